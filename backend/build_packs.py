@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Build the static broker packs served from frontend/public/broker-packs.
+
+Each source pack is validated like an upload to POST /api/broker-packs: the BrokerEntry
+schema, unique ids, absolute http(s) opt_out_urls and known form types. The normalized
+pack is then written as compact JSON under a content-hashed name, with gzip and brotli
+copies next to it:
+
+    python backend/build_packs.py broker-packs/*.json
+
+manifest.json lists every built file with its size and SRI integrity hash. latest.json
+points at the latest pack. Hashed files never change, so they can be cached forever; only
+latest.json and manifest.json need revalidating. Output is deterministic, so rebuilding
+unchanged sources rewrites identical files.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import typer
+
+from models import BrokerEntry, BrokerPackCreate
+from pack_validation import DEFAULT_FORM_TYPES, PackValidator
+
+try:
+    import brotli
+except ImportError:  # optional: packs are then precompressed with gzip only
+    brotli = None
+
+ROOT_DIR = Path(__file__).parent
+DEFAULT_OUT_DIR = ROOT_DIR.parent / "frontend" / "public" / "broker-packs"
+
+# Hex digits of the SHA-256 kept in built file names.
+HASH_LENGTH = 12
+MAX_REPORTED_ERRORS = 100
+
+app = typer.Typer(add_completion=False)
+
+
+def validate_source(raw: object, form_types: List[str]) -> Tuple[Optional[dict], List[str]]:
+    """Return the normalized pack, or None and the validation errors as "loc: message" lines."""
+    validator = PackValidator(BrokerEntry, form_types, MAX_REPORTED_ERRORS)
+    if not isinstance(raw, dict):
+        return None, ["Source must be a JSON object"]
+
+    has_brokers = isinstance(raw.get("brokers"), list)
+    brokers = validator.check_batch(0, raw["brokers"]) if has_brokers else []
+    fields = validator.check_fields(raw, has_brokers, BrokerPackCreate)
+    if validator.error_count:
+        errors = [f"{'.'.join(map(str, error['loc'][1:]))}: {error['msg']}" for error in validator.errors]
+        if validator.error_count > len(errors):
+            errors.append(f"... and {validator.error_count - len(errors)} more")
+        return None, errors
+
+    pack = {key: value for key, value in fields.items() if key != "brokers" and value is not None}
+    pack["brokers"] = brokers
+    return pack, []
+
+
+def integrity(body: bytes) -> str:
+    return "sha256-" + base64.b64encode(hashlib.sha256(body).digest()).decode("ascii")
+
+
+def encode_pack(pack: dict) -> Dict[str, bytes]:
+    """The pack's JSON body keyed by content encoding ("identity", "gzip" and, if available, "br")."""
+    body = json.dumps(pack, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    encoded = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body, quality=11)
+    return encoded
+
+
+def write_file(path: Path, body: bytes) -> None:
+    """Replace path atomically, so a server never sees a half-written file."""
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.write_bytes(body)
+    os.replace(temporary, path)
+
+
+def build_pack(pack: dict, out: Path) -> dict:
+    """Write one pack's hashed files into out; return its manifest entry."""
+    encoded = encode_pack(pack)
+    body = encoded["identity"]
+    name = f"{pack['version']}.{hashlib.sha256(body).hexdigest()[:HASH_LENGTH]}.json"
+    entry = {
+        "file": name,
+        "bytes": len(body),
+        "integrity": integrity(body),
+        "brokers": len(pack["brokers"]),
+        "updated_at": pack.get("updated_at"),
+        "encodings": {},
+    }
+    write_file(out / name, body)
+    for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+        if encoding in encoded:
+            write_file(out / (name + suffix), encoded[encoding])
+            entry["encodings"][encoding] = {
+                "file": name + suffix,
+                "bytes": len(encoded[encoding]),
+                "integrity": integrity(encoded[encoding]),
+            }
+    return entry
+
+
+def manifest_files(manifest: dict) -> List[str]:
+    return [
+        name
+        for entry in manifest.get("packs", {}).values()
+        for name in [entry["file"], *(encoded["file"] for encoded in entry.get("encodings", {}).values())]
+    ]
+
+
+def dump(document: dict) -> bytes:
+    return (json.dumps(document, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@app.command()
+def build(
+    sources: List[Path] = typer.Argument(..., exists=True, dir_okay=False, help="Source pack JSON files"),
+    out: Path = typer.Option(DEFAULT_OUT_DIR, file_okay=False, help="Directory to write the built packs to"),
+    latest: Optional[str] = typer.Option(None, help="Version latest.json points at (default: the last source)"),
+    base_url: str = typer.Option("/broker-packs", help="URL path the output directory is served under"),
+    form_types: str = typer.Option(",".join(DEFAULT_FORM_TYPES), help="Comma-separated accepted form types"),
+    prune: bool = typer.Option(False, help="Delete files of the previous manifest that are no longer built"),
+):
+    """Validate source packs and write hashed, precompressed packs, manifest.json and latest.json."""
+    accepted = [form_type.strip() for form_type in form_types.split(",") if form_type.strip()]
+    packs = {}
+    failed = False
+    for source in sources:
+        try:
+            raw = json.loads(source.read_text(encoding="utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as error:
+            typer.echo(f"{source}: not valid JSON: {error}", err=True)
+            failed = True
+            continue
+        pack, errors = validate_source(raw, accepted)
+        for error in errors:
+            typer.echo(f"{source}: {error}", err=True)
+        if pack is None:
+            failed = True
+        elif pack["version"] in packs:
+            typer.echo(f"{source}: version {pack['version']} is built from more than one source", err=True)
+            failed = True
+        else:
+            packs[pack["version"]] = pack
+    if failed:
+        raise typer.Exit(1)
+
+    latest = latest or list(packs)[-1]
+    if latest not in packs:
+        typer.echo(f"--latest {latest} is not one of the built versions", err=True)
+        raise typer.Exit(1)
+
+    out.mkdir(parents=True, exist_ok=True)
+    manifest_path = out / "manifest.json"
+    previous = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest_path.exists() else {}
+
+    manifest = {"latest": latest, "packs": {version: build_pack(pack, out) for version, pack in packs.items()}}
+    latest_entry = manifest["packs"][latest]
+    # latest.json goes last, so it never points at a file that has not been written yet.
+    write_file(manifest_path, dump(manifest))
+    write_file(out / "latest.json", dump({
+        "version": latest,
+        "url": f"{base_url.rstrip('/')}/{latest_entry['file']}",
+        "updated_at": latest_entry["updated_at"],
+        "integrity": latest_entry["integrity"],
+    }))
+
+    if prune:
+        for name in set(manifest_files(previous)) - set(manifest_files(manifest)):
+            (out / name).unlink(missing_ok=True)
+
+    for version, entry in manifest["packs"].items():
+        sizes = ", ".join(f"{encoding} {encoded['bytes']} B" for encoding, encoded in entry["encodings"].items())
+        typer.echo(f"{version}: {entry['file']} ({entry['brokers']} brokers, {entry['bytes']} B; {sizes})")
+    typer.echo(f"latest.json -> {latest}")
+
+
+if __name__ == "__main__":
+    app()
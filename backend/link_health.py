@@ -0,0 +1,133 @@
+"""Concurrent reachability checks for broker opt_out_urls.
+
+LinkChecker checks each distinct URL once per run with a fixed pool of workers, which
+bounds the requests in flight. Each host's URLs are split into at most per_host lanes, and
+a worker drains a whole lane before taking the next, so no host sees more than per_host
+concurrent requests. Each worker owns a single-connection httpx client, so it keeps
+reusing one kept-alive connection along a lane (a shared pool would be rescanned on
+every request, which gets slow at this concurrency). Results are cached for ttl_seconds
+and reused by later runs and by reports.
+"""
+
+import asyncio
+import ssl
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from metrics import LINK_CHECKS
+
+# Servers that refuse HEAD with these are asked again with a GET, without reading the body.
+HEAD_UNSUPPORTED_STATUSES = (403, 405, 501)
+
+
+def host_lanes(urls: List[str], per_host: int) -> List[Iterator[str]]:
+    """Up to per_host lanes per host, each sharing that host's iterator of urls.
+
+    Lanes are ordered round-robin across hosts, so a run starts on as many hosts as it can.
+    """
+    by_host: Dict[str, List[str]] = OrderedDict()
+    for url in urls:
+        by_host.setdefault(urlsplit(url).netloc.lower(), []).append(url)
+    lanes_by_host = [
+        [iter(host_urls)] * min(per_host, len(host_urls)) for host_urls in by_host.values()
+    ]
+    lanes = []
+    for rank in range(per_host):
+        lanes += [host_lanes[rank] for host_lanes in lanes_by_host if rank < len(host_lanes)]
+    return lanes
+
+
+class LinkChecker:
+    """Checks URLs over a bounded pool of workers and caches each result for ttl_seconds."""
+
+    def __init__(
+        self,
+        concurrency: int,
+        per_host: int,
+        timeout_seconds: float,
+        ttl_seconds: float,
+        user_agent: str = "datawipe-link-check",
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout_seconds = timeout_seconds
+        self.ttl_seconds = ttl_seconds
+        self.user_agent = user_agent
+        self.clock = clock
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        # url -> (expires at, result)
+        self.results: Dict[str, tuple] = {}
+
+    def cached(self, url: str) -> Optional[dict]:
+        """The result of the last check of url, unless it has expired."""
+        cached = self.results.get(url)
+        if cached is None or cached[0] <= self.clock():
+            return None
+        return cached[1]
+
+    def prune(self) -> None:
+        now = self.clock()
+        for url in [url for url, (expires_at, _) in self.results.items() if expires_at <= now]:
+            del self.results[url]
+
+    async def check_all(self, urls: Iterable[str]) -> Dict[str, dict]:
+        """Check every distinct url without a cached result; return the results of all of them."""
+        self.prune()
+        distinct = list(dict.fromkeys(urls))
+        pending = [url for url in distinct if self.cached(url) is None]
+        if pending:
+            await self.run(pending)
+        return {url: self.cached(url) for url in distinct}
+
+    async def run(self, urls: List[str]) -> None:
+        # Imported on first use, so importing server.py does not pay for httpx.
+        import httpx
+
+        lanes = iter(host_lanes(urls, self.per_host))
+        if self.ssl_context is None:
+            # Loading CA certificates is slow, so every worker's client shares one context.
+            self.ssl_context = httpx.create_ssl_context()
+
+        async def worker():
+            async with httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+                timeout=self.timeout_seconds,
+                follow_redirects=True,
+                headers={"User-Agent": self.user_agent},
+                verify=self.ssl_context
+            ) as client:
+                for lane in lanes:
+                    for url in lane:
+                        result = await self.check(client, url)
+                        self.results[url] = (self.clock() + self.ttl_seconds, result)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(urls)))))
+
+    async def check(self, client, url: str) -> dict:
+        import httpx
+
+        started = time.perf_counter()
+        status = None
+        error = None
+        try:
+            response = await client.head(url)
+            status = response.status_code
+            if status in HEAD_UNSUPPORTED_STATUSES:
+                async with client.stream("GET", url) as response:
+                    status = response.status_code
+        except (httpx.HTTPError, httpx.InvalidURL) as failure:
+            error = f"{type(failure).__name__}: {failure}" if str(failure) else type(failure).__name__
+
+        ok = status is not None and status < 400
+        LINK_CHECKS.labels(result="ok" if ok else ("error" if error else "broken")).inc()
+        return {
+            "ok": ok,
+            "status": status,
+            "error": error,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "checked_at": datetime.utcnow().isoformat(),
+        }
@@ -0,0 +1,176 @@
+"""Prometheus metrics for the backend, served as text at /metrics.
+
+Metrics are per process; with several uvicorn workers each worker reports its own.
+"""
+
+import inspect
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Response body size as sent, after any content encoding.",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled.",
+)
+STORAGE_LATENCY = Histogram(
+    "storage_operation_duration_seconds",
+    "Time spent in a storage repository call (database round trips included).",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+STORAGE_ERRORS = Counter(
+    "storage_operation_errors_total",
+    "Storage repository calls that raised.",
+    ["operation"],
+)
+SERIALIZATION_LATENCY = Histogram(
+    "serialization_duration_seconds",
+    "Time spent validating and encoding stored documents into response bodies.",
+    ["kind"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Lookups against the in-process caches, by outcome.",
+    ["cache", "result"],
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total",
+    "Lookups routed through a single-flight group: leader ran the call, coalesced awaited it.",
+    ["group", "result"],
+)
+RATE_LIMIT_REQUESTS = Counter(
+    "rate_limit_requests_total",
+    "Admission decisions of the token-bucket rate limiter, by budget and outcome.",
+    ["budget", "result"],
+)
+
+LINK_CHECKS = Counter(
+    "link_checks_total",
+    "Opt-out URL checks: ok (< 400), broken (>= 400) or error (no response).",
+    ["result"],
+)
+
+
+def record_cache(cache: str, result: str) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result=result).inc()
+
+
+class MetricsMiddleware:
+    """Records latency, response size and in-flight count per matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; fall back to a fixed label
+            # so unmatched paths cannot blow up label cardinality.
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            REQUEST_LATENCY.labels(method=method, route=route_path, status=str(status)).observe(
+                time.perf_counter() - started
+            )
+            RESPONSE_SIZE.labels(method=method, route=route_path).observe(size)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+class TimedRepository:
+    """Proxy that times every coroutine and async generator method of a repository."""
+
+    def __init__(self, repository, name: str):
+        self._repository = repository
+        self._name = name
+
+    def __getattr__(self, attribute):
+        value = getattr(self._repository, attribute)
+        operation = f"{self._name}.{attribute}"
+        if inspect.iscoroutinefunction(value):
+            return timed_coroutine(value, operation)
+        if inspect.isasyncgenfunction(value):
+            return timed_async_generator(value, operation)
+        return value
+
+
+def timed_coroutine(function, operation):
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        except Exception:
+            STORAGE_ERRORS.labels(operation=operation).inc()
+            raise
+        finally:
+            STORAGE_LATENCY.labels(operation=operation).observe(time.perf_counter() - started)
+    return wrapper
+
+
+def timed_async_generator(function, operation):
+    async def wrapper(*args, **kwargs):
+        # Only time spent producing items counts, not time the consumer holds each one.
+        elapsed = 0.0
+        generator = function(*args, **kwargs)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = await generator.__anext__()
+                except StopAsyncIteration:
+                    break
+                except Exception:
+                    STORAGE_ERRORS.labels(operation=operation).inc()
+                    raise
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            await generator.aclose()
+            STORAGE_LATENCY.labels(operation=operation).observe(elapsed)
+    return wrapper
+
+
+def instrument_storage(storage):
+    storage.packs = TimedRepository(storage.packs, "packs")
+    storage.status_checks = TimedRepository(storage.status_checks, "status_checks")
+    return storage
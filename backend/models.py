@@ -0,0 +1,25 @@
+"""Broker pack models shared by the API (server.py) and the offline pack build (build_packs.py).
+
+Kept free of server imports so tools can validate packs without configuring storage.
+"""
+
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class BrokerEntry(BaseModel):
+    id: str
+    name: str
+    opt_out_url: str
+    form_type: str = 'web'
+    required_fields: List[str] = []
+    verification_steps: Optional[str] = ''
+    response_time: Optional[str] = ''
+    follow_up_guidance: Optional[str] = ''
+
+class BrokerPackCreate(BaseModel):
+    version: str
+    brokers: List[BrokerEntry]
+    notes: Optional[str] = None
+    updated_at: Optional[str] = None
@@ -0,0 +1,273 @@
+"""Incremental parsing and validation of broker pack uploads.
+
+PackStreamParser reads a pack's JSON object from the request body chunk by chunk and
+yields its top-level fields and each entry of its brokers array as soon as it is
+complete, so the raw body is never held in memory. PackValidator checks entries in
+batches: the entry schema, duplicate ids, opt_out_url normalization and known form
+types. Errors use FastAPI's validation error shape, with the entry index in loc.
+"""
+
+import codecs
+import json
+import re
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from pydantic import TypeAdapter, ValidationError
+
+# Broker form types accepted when none are configured.
+DEFAULT_FORM_TYPES = ("web", "email", "mail", "phone")
+
+
+class PackStreamError(ValueError):
+    """The upload is not a well-formed JSON pack object."""
+
+
+class PackStreamParser:
+    """Splits {"version": ..., "brokers": [...], ...} into fields and entries as bytes arrive.
+
+    Only the value currently being decoded is buffered; a single value larger than
+    max_value_bytes is rejected rather than read to the end.
+    """
+
+    WHITESPACE = " \t\r\n"
+    NUMBER_END = WHITESPACE + ",]}"
+
+    def __init__(self, chunks: AsyncIterator[bytes], max_value_bytes: int):
+        self.chunks = chunks.__aiter__()
+        self.max_value_bytes = max_value_bytes
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+        self.seen_brokers = False
+
+    async def fill(self) -> bool:
+        """Append the next chunk, dropping what has been consumed; False at end of stream."""
+        if self.exhausted:
+            return False
+        self.buffer = self.buffer[self.position:]
+        self.position = 0
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.exhausted = True
+            self.buffer += self.decoder.decode(b"", final=True)
+            return False
+        try:
+            self.buffer += self.decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise PackStreamError("Body is not valid UTF-8")
+        return True
+
+    async def peek(self) -> str:
+        """The next non-whitespace character, or "" at end of stream."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in self.WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not await self.fill():
+                return ""
+
+    async def expect(self, characters: str) -> str:
+        character = await self.peek()
+        if not character or character not in characters:
+            found = repr(character) if character else "end of body"
+            raise PackStreamError(f"Expected {' or '.join(repr(c) for c in characters)}, found {found}")
+        self.position += 1
+        return character
+
+    async def value(self):
+        await self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.position)
+                # A number may continue in the next chunk, even after "1." or "1e", so it is only
+                # complete once a delimiter follows it.
+                number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if self.exhausted or (
+                    end < len(self.buffer) and (not number or self.buffer[end] in self.NUMBER_END)
+                ):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError as error:
+                if self.exhausted:
+                    raise PackStreamError(f"Invalid JSON: {error.msg}")
+            if len(self.buffer) - self.position > self.max_value_bytes:
+                raise PackStreamError(f"A value exceeds {self.max_value_bytes} bytes or is not valid JSON")
+            await self.fill()
+
+    async def events(self) -> AsyncIterator[Tuple[str, object, object]]:
+        """Yield ("field", name, value) for top-level fields and ("broker", index, entry) per entry."""
+        await self.expect("{")
+        if await self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = await self.value()
+            if not isinstance(key, str):
+                raise PackStreamError("Expected a field name")
+            await self.expect(":")
+            if key == "brokers":
+                if self.seen_brokers:
+                    raise PackStreamError("Duplicate brokers field")
+                self.seen_brokers = True
+                async for index, entry in self.array():
+                    yield "broker", index, entry
+            else:
+                yield "field", key, await self.value()
+            if await self.expect(",}") == "}":
+                break
+        if await self.peek():
+            raise PackStreamError("Unexpected data after the pack object")
+
+    async def array(self) -> AsyncIterator[Tuple[int, object]]:
+        await self.expect("[")
+        if await self.peek() == "]":
+            self.position += 1
+            return
+        index = 0
+        while True:
+            yield index, await self.value()
+            index += 1
+            if await self.expect(",]") == "]":
+                return
+
+
+WHITESPACE_PATTERN = re.compile(r"\s")
+
+
+def normalize_url(url: str) -> Optional[str]:
+    """Trimmed absolute http(s) URL with a lower-cased scheme and host, or None if malformed."""
+    url = url.strip()
+    if WHITESPACE_PATTERN.search(url):
+        return None
+    try:
+        parts = urlsplit(url)
+        hostname = parts.hostname
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not hostname or "@" in parts.netloc:
+        return None
+    host = f"[{hostname}]" if ":" in hostname else hostname
+    netloc = f"{host}:{port}" if port else host
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+
+class PackValidator:
+    """Validates broker entries in batches and collects errors, keeping at most max_errors.
+
+    Only the set of seen ids grows with the pack; entries are handed back to the caller.
+    """
+
+    def __init__(self, entry_model, form_types: Iterable[str], max_errors: int):
+        self.entry_model = entry_model
+        self.batch_adapter = TypeAdapter(List[entry_model])
+        self.form_types = frozenset(form_types)
+        self.max_errors = max_errors
+        self.ids = set()
+        self.errors: List[dict] = []
+        self.error_count = 0
+        self.entries_checked = 0
+
+    def add_error(self, loc: list, message: str, error_type: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"loc": loc, "msg": message, "type": error_type})
+
+    def check_batch(self, start: int, raw_entries: List[object]) -> List[dict]:
+        """Return the valid, normalized entries of raw_entries, which start at index start."""
+        self.entries_checked += len(raw_entries)
+        try:
+            # Fast path: the whole batch passes the schema in one call.
+            models = self.batch_adapter.validate_python(raw_entries)
+        except ValidationError:
+            models = None
+
+        valid = []
+        for offset, raw in enumerate(raw_entries):
+            # Without the fast path, check entries one by one so errors stay in index order.
+            model = models[offset] if models is not None else self.check_schema(start + offset, raw)
+            if model is None:
+                continue
+            entry = model.model_dump()
+            if self.check_entry(start + offset, entry):
+                valid.append(entry)
+        return valid
+
+    def check_schema(self, index: int, raw: object):
+        try:
+            return self.entry_model.model_validate(raw)
+        except ValidationError as error:
+            for detail in error.errors():
+                self.add_error(["body", "brokers", index, *detail["loc"]], detail["msg"], detail["type"])
+            return None
+
+    def check_entry(self, index: int, entry: dict) -> bool:
+        valid = True
+        if entry["id"] in self.ids:
+            self.add_error(["body", "brokers", index, "id"], f"Duplicate broker id {entry['id']!r}", "value_error.duplicate")
+            valid = False
+        self.ids.add(entry["id"])
+
+        url = normalize_url(entry["opt_out_url"])
+        if url is None:
+            self.add_error(["body", "brokers", index, "opt_out_url"], "Not an absolute http(s) URL", "value_error.url")
+            valid = False
+        else:
+            entry["opt_out_url"] = url
+
+        if entry["form_type"] not in self.form_types:
+            self.add_error(
+                ["body", "brokers", index, "form_type"],
+                f"Unknown form_type {entry['form_type']!r}; expected one of {', '.join(sorted(self.form_types))}",
+                "value_error.form_type"
+            )
+            valid = False
+        return valid
+
+    def check_fields(self, fields: dict, has_brokers: bool, pack_model) -> Optional[dict]:
+        """Validate the pack's top-level fields, which were checked without their brokers.
+
+        Returns the normalized fields (with an empty brokers list), or None if invalid.
+        """
+        try:
+            return pack_model.model_validate({**fields, "brokers": []} if has_brokers else fields).model_dump()
+        except ValidationError as error:
+            for detail in error.errors():
+                self.add_error(["body", *detail["loc"]], detail["msg"], detail["type"])
+            return None
+
+
+async def read_pack(
+    parser: PackStreamParser, validator: PackValidator, pack_model, batch_size: int, keep_entries: bool
+) -> Tuple[Optional[dict], List[dict]]:
+    """Stream a pack through the validator; return its validated top-level fields and valid entries.
+
+    With keep_entries=False memory stays flat: only one batch of raw entries is held at a time.
+    """
+    fields = {}
+    entries = []
+    batch = []
+    start = 0
+    async for kind, key, value in parser.events():
+        if kind == "field":
+            fields[key] = value
+            continue
+        if not batch:
+            start = key
+        batch.append(value)
+        if len(batch) == batch_size:
+            valid = validator.check_batch(start, batch)
+            if keep_entries:
+                entries.extend(valid)
+            batch = []
+    if batch:
+        valid = validator.check_batch(start, batch)
+        if keep_entries:
+            entries.extend(valid)
+    return validator.check_fields(fields, parser.seen_brokers, pack_model), entries
@@ -0,0 +1,250 @@
+"""Opt-in, per-request sampling profiles, stored in memory for admins to read back.
+
+While a profiled request is in flight, a background thread samples the stack of every
+other thread in the process every interval_seconds and counts the samples in a call tree
+per thread. Sampling sees the whole process, not just the request's task: the event loop
+thread also runs any concurrent requests, and Motor runs the PyMongo driver (network I/O
+and BSON decoding) in its executor threads, which is why those are sampled too. Only one
+request is profiled at a time. Profiles are per process; with several uvicorn workers
+each worker keeps its own.
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from starlette.exceptions import HTTPException
+
+# Request header that asks for a profile of this request; it needs the admin bearer token.
+PROFILE_HEADER = b"x-profile"
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts sampled stacks of every thread but its own into {thread id: call tree}.
+
+    A node is [samples, samples as the innermost frame, {label: child node}].
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.trees: Dict[int, list] = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        labels = {}
+        while not self.stopped.wait(self.interval_seconds):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                node = self.trees.get(thread_id)
+                if node is None:
+                    node = self.trees[thread_id] = [0, 0, {}]
+                node[0] += 1
+                for label in reversed(stack):
+                    child = node[2].get(label)
+                    if child is None:
+                        child = node[2][label] = [0, 0, {}]
+                    child[0] += 1
+                    node = child
+                node[1] += 1
+
+
+def render_tree(node: list, min_samples: int, ms_per_sample: float) -> List[dict]:
+    """The children of node as dicts, heaviest first, leaving out those under min_samples."""
+    return [
+        {
+            "function": label,
+            "samples": child[0],
+            "self_samples": child[1],
+            "ms": round(child[0] * ms_per_sample, 1),
+            "children": render_tree(child, min_samples, ms_per_sample),
+        }
+        for label, child in sorted(node[2].items(), key=lambda item: item[1][0], reverse=True)
+        if child[0] >= min_samples
+    ]
+
+
+class ProfileStore:
+    """The max_profiles most recent profiles, oldest evicted first."""
+
+    def __init__(self, max_profiles: int):
+        self.max_profiles = max_profiles
+        self.profiles: "OrderedDict[str, dict]" = OrderedDict()
+
+    def add(self, profile: dict) -> None:
+        self.profiles[profile["id"]] = profile
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return self.profiles.get(profile_id)
+
+    def summaries(self) -> List[dict]:
+        """Every stored profile without its call trees, newest first."""
+        return [
+            {key: value for key, value in profile.items() if key != "threads"}
+            for profile in reversed(self.profiles.values())
+        ]
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry X-Profile (admins only) and a sample_rate fraction of all others.
+
+    authorize(authorization header) raises HTTPException unless the caller is an admin; a
+    profile request that fails it is answered with that error, without calling the app.
+    Profiles of requests an admin asked for are named in the X-Profile-Id response header.
+    Call tree nodes under min_share of a thread's samples are left out.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: ProfileStore,
+        authorize: Callable[[Optional[str]], None],
+        sample_rate: float = 0.0,
+        interval_seconds: float = 0.001,
+        min_share: float = 0.005,
+        random_fraction: Callable[[], float] = random.random
+    ):
+        self.app = app
+        self.store = store
+        self.authorize = authorize
+        self.sample_rate = sample_rate
+        self.interval_seconds = interval_seconds
+        self.min_share = min_share
+        self.random_fraction = random_fraction
+        self.active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = False
+        authorization = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                requested = True
+            elif name == b"authorization":
+                authorization = value
+        if requested:
+            try:
+                self.authorize(authorization.decode("latin-1") if authorization else None)
+            except HTTPException as error:
+                await send_error(send, error.status_code, error.detail)
+                return
+        elif not (self.sample_rate and self.random_fraction() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        if self.active:
+            # The sampler already sees the whole process; a second one would only add overhead.
+            if requested:
+                send = with_headers(send, [(b"x-profile", b"busy")])
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = str(uuid.uuid4())
+        if requested:
+            send = with_headers(send, [(b"x-profile-id", profile_id.encode())])
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.active = True
+        sampler = StackSampler(self.interval_seconds)
+        started_at = datetime.utcnow().isoformat()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - started
+            self.active = False
+            # A sampled request that finished before the first sample would only evict useful profiles.
+            if requested or sampler.samples:
+                self.store.add(self.build_profile(
+                    profile_id, scope, status, "header" if requested else "sample", started_at, elapsed, sampler
+                ))
+
+    def build_profile(
+        self, profile_id: str, scope, status: int, trigger: str, started_at: str, elapsed: float,
+        sampler: StackSampler
+    ) -> dict:
+        # A thread running Python code holds the GIL for up to sys.getswitchinterval() (5 ms by
+        # default), which delays samples, so time is estimated from each node's share of samples.
+        ms_per_sample = elapsed * 1000 / sampler.samples if sampler.samples else 0.0
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        threads = []
+        for thread_id, tree in sorted(sampler.trees.items(), key=lambda item: item[1][0], reverse=True):
+            threads.append({
+                "thread": thread_names.get(thread_id, str(thread_id)),
+                "samples": tree[0],
+                "tree": render_tree(tree, max(1, int(tree[0] * self.min_share)), ms_per_sample),
+            })
+        route = scope.get("route")
+        return {
+            "id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(route, "path", None),
+            "status": status,
+            "trigger": trigger,
+            "started_at": started_at,
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "interval_ms": self.interval_seconds * 1000,
+            "samples": sampler.samples,
+            "threads": threads,
+        }
+
+
+def with_headers(send, extra_headers: list):
+    async def send_wrapper(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []), *extra_headers]}
+        await send(message)
+    return send_wrapper
+
+
+async def send_error(send, status: int, detail) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,172 @@
+"""In-process token-bucket admission control, applied before requests reach a route.
+
+Each budget (e.g. public reads, admin writes) has one bucket per client IP and one
+shared global bucket; a request is admitted only if both have a token. A budget can
+reserve its global bucket for authenticated requests, so anonymous callers cannot use
+it up. Limits are per process; with several uvicorn workers each worker enforces its own.
+"""
+
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+from metrics import RATE_LIMIT_REQUESTS
+
+
+class TokenBucket:
+    """Holds up to burst tokens, refilled continuously at rate tokens per second."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self) -> float:
+        """Seconds until the next token is available."""
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """A per-client and a global token bucket for one budget.
+
+    A rate of 0 disables that bucket. Per-client buckets are kept for the max_clients
+    most recently seen clients; an evicted client starts again with a full bucket. With
+    global_authenticated_only, unauthenticated requests only draw from their client bucket.
+    """
+
+    def __init__(
+        self,
+        client_rate: float,
+        client_burst: float,
+        global_rate: float,
+        global_burst: float,
+        max_clients: int = 10000,
+        global_authenticated_only: bool = False,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self.global_authenticated_only = global_authenticated_only
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock()) if global_rate else None
+        self.client_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def client_bucket(self, client: str, now: float) -> Optional[TokenBucket]:
+        if not self.client_rate:
+            return None
+        bucket = self.client_buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.client_rate, self.client_burst, now)
+            self.client_buckets[client] = bucket
+            if len(self.client_buckets) > self.max_clients:
+                self.client_buckets.popitem(last=False)
+        else:
+            self.client_buckets.move_to_end(client)
+        return bucket
+
+    def acquire(self, client: str, authenticated: bool = True):
+        """Take a token from both buckets, or neither.
+
+        Returns (None, None) when admitted, else the limiting scope ("client" or "global")
+        and the seconds to wait before retrying.
+        """
+        now = self.clock()
+        global_bucket = self.global_bucket
+        if self.global_authenticated_only and not authenticated:
+            global_bucket = None
+        buckets = [
+            (scope, bucket)
+            for scope, bucket in (("client", self.client_bucket(client, now)), ("global", global_bucket))
+            if bucket is not None
+        ]
+        for scope, bucket in buckets:
+            bucket.refill(now)
+            if bucket.tokens < 1:
+                return scope, bucket.retry_after()
+
+        for _, bucket in buckets:
+            bucket.tokens -= 1
+        return None, None
+
+
+def header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_address(scope, trusted_proxies: Iterable[str]) -> str:
+    """The peer address, or the X-Real-IP a trusted reverse proxy set for it."""
+    peer = scope["client"][0] if scope.get("client") else "unknown"
+    if peer in trusted_proxies:
+        real_ip = header(scope, b"x-real-ip")
+        if real_ip is not None:
+            return real_ip.strip()
+    return peer
+
+
+class RateLimitMiddleware:
+    """Answers 429 with Retry-After, without calling the app, when a budget is exhausted.
+
+    classify(method, path) names the budget a request draws from, or None to exempt it.
+    authenticate(authorization header) tells whether a request counts as authenticated for
+    limiters with global_authenticated_only; without it, every request does.
+    """
+
+    def __init__(
+        self,
+        app,
+        limiters: Dict[str, RateLimiter],
+        classify: Callable[[str, str], Optional[str]],
+        trusted_proxies: Iterable[str] = (),
+        authenticate: Optional[Callable[[Optional[str]], bool]] = None
+    ):
+        self.app = app
+        self.limiters = limiters
+        self.classify = classify
+        self.trusted_proxies = frozenset(trusted_proxies)
+        self.authenticate = authenticate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = self.classify(scope["method"], scope["path"])
+        limiter = self.limiters.get(budget) if budget else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        authenticated = True
+        if limiter.global_authenticated_only and self.authenticate is not None:
+            authenticated = self.authenticate(header(scope, b"authorization"))
+        limited_by, retry_after = limiter.acquire(client_address(scope, self.trusted_proxies), authenticated)
+        if limited_by is None:
+            RATE_LIMIT_REQUESTS.labels(budget=budget, result="allowed").inc()
+            await self.app(scope, receive, send)
+            return
+
+        RATE_LIMIT_REQUESTS.labels(budget=budget, result=f"limited_{limited_by}").inc()
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,32 +1,254 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import State
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import json
+import re
+import bisect
+import asyncio
+import base64
 import logging
+import operator
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Optional, Set, Tuple
 import uuid
-from datetime import datetime
+import time
+import hashlib
+import heapq
+import gzip
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import partial
+from itertools import islice
+import dataclasses
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from metrics import (
+    SERIALIZATION_LATENCY,
+    SINGLE_FLIGHT_CALLS,
+    MetricsMiddleware,
+    instrument_storage,
+    metrics_endpoint,
+    record_cache,
+)
+from link_health import LinkChecker
+from models import BrokerEntry, BrokerPackCreate
+from pack_validation import DEFAULT_FORM_TYPES, PackStreamError, PackStreamParser, PackValidator, read_pack
+from profiling import ProfileStore, ProfilingMiddleware
+from ratelimit import RateLimiter, RateLimitMiddleware
+from storage import ROLLUP_BUCKETS, MemoryStorage, MongoStorage, SQLiteStorage, Storage, StatusCursor, bucket_start
+
+try:
+    import brotli
+except ImportError:  # optional: packs are then precompressed with gzip only
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # optional: read endpoints then encode with the stdlib json module
+    orjson = None
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
 
-ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+@dataclass(frozen=True)
+class Settings:
+    """Everything create_app needs to configure an app. from_env() reads each field from the
+    environment variable of the same name in upper case (e.g. ADMIN_TOKEN), where set."""
+
+    # Persistence backend: "mongo" (default), "sqlite" (sqlite_path) or "memory".
+    storage_backend: str = 'mongo'
+    mongo_url: str = ''
+    db_name: str = ''
+    sqlite_path: str = str(ROOT_DIR / 'datawipe.sqlite3')
+    # Motor connection pool and timeouts (the driver's defaults); a socket timeout of 0 means none.
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_connect_timeout_ms: int = 20000
+    mongo_server_selection_timeout_ms: int = 30000
+    mongo_socket_timeout_ms: int = 0
+    # Wire compressors offered to MongoDB in order, e.g. "zstd,snappy,zlib" (zstd and snappy need
+    # the zstandard and python-snappy packages); empty sends uncompressed.
+    mongo_compressors: str = ''
+    # Deduplicated broker entries kept decoded in memory, shared by every pack version that lists them.
+    broker_entry_cache_size: int = 20000
+    log_level: str = 'INFO'
+
+    admin_token: str = ''
+
+    # Seconds a cached latest pack is served before the meta pointer is re-checked.
+    # Keeps multiple uvicorn workers converging after a publish on another worker.
+    latest_pack_revalidate_seconds: float = 5.0
+
+    # Upper bound on the storage ping made by each /api/readyz call after warmup.
+    readiness_ping_timeout_seconds: float = 2.0
+
+    status_batch_max_items: int = 5000
+
+    # Optional write-behind mode for POST /api/status: inserts are buffered and written
+    # with insert_many once status_flush_max_items are pending or every
+    # status_flush_interval_seconds, and on shutdown. Failed flushes are retried; buffered checks
+    # are lost on a crash.
+    status_write_behind: bool = False
+    status_flush_max_items: int = 200
+    status_flush_interval_seconds: float = 1.0
+
+    # Token-bucket admission control, per client IP and across all clients, in requests per second
+    # with a burst allowance. "public" covers every /api route except the probes and admin writes,
+    # which draw from "admin". A rate of 0 disables that bucket. X-Real-IP is honoured only from
+    # rate_limit_trusted_proxies (the bundled nginx connects from 127.0.0.1). rate_limit_enabled=False
+    # turns admission control off.
+    rate_limit_enabled: bool = True
+    rate_limit_public_client_rate: float = 20.0
+    rate_limit_public_client_burst: float = 40.0
+    rate_limit_public_global_rate: float = 500.0
+    rate_limit_public_global_burst: float = 1000.0
+    rate_limit_admin_client_rate: float = 2.0
+    rate_limit_admin_client_burst: float = 10.0
+    rate_limit_admin_global_rate: float = 5.0
+    rate_limit_admin_global_burst: float = 20.0
+    rate_limit_trusted_proxies: Tuple[str, ...] = ('127.0.0.1', '::1')
+
+    # Retention: raw status checks older than status_retention_days are deleted (0 keeps them
+    # forever). Their rollups outlive them; minute rollups can be dropped after
+    # status_minute_rollup_retention_days, leaving hour and day buckets. Expiry runs every
+    # status_retention_interval_seconds (Mongo expires raw checks itself through a TTL index).
+    status_retention_days: float = 0.0
+    status_minute_rollup_retention_days: float = 0.0
+    status_retention_interval_seconds: float = 3600.0
+
+    # The most buckets one GET /api/status/rollup query may span.
+    status_rollup_max_buckets: int = 10000
+
+    # Pack upload validation: accepted broker form types, the largest single JSON value (e.g.
+    # one broker entry) read from an upload, and how many errors are reported (all are counted).
+    broker_form_types: Tuple[str, ...] = DEFAULT_FORM_TYPES
+    pack_upload_max_value_bytes: int = 1024 * 1024
+    pack_validation_max_errors: int = 1000
+
+    # Bulk import: packs written per insert_many, and the largest single NDJSON line accepted.
+    import_batch_size: int = 50
+    import_max_line_bytes: int = 64 * 1024 * 1024
+
+    # Number of most recent pack versions a new publish precomputes diffs from. Only those diffs
+    # are stored; other pairs are computed on request and the most recent diff_cache_size kept.
+    broker_pack_diff_history: int = 5
+    diff_cache_size: int = 64
+
+    # Number of pack versions whose search index is kept in memory.
+    search_index_cache_size: int = 4
+
+    # The largest page of GET /api/broker-packs/{version}/brokers.
+    broker_page_max_limit: int = 1000
+
+    # Opt-out URL health checks: requests in flight per run, in flight per host, per-request
+    # timeout, and how long a result is reused before the URL is checked again.
+    link_check_concurrency: int = 100
+    link_check_per_host: int = 4
+    link_check_timeout_seconds: float = 10.0
+    link_check_ttl_seconds: float = 6 * 3600.0
+
+    # Request profiling: the fraction of all requests profiled without an admin asking for it
+    # (0 = only on request), the stack sampling interval and how many profiles are kept.
+    profile_sample_rate: float = 0.0
+    profile_interval_ms: float = 1.0
+    profile_history: int = 50
+
+    # Compression effort for the encodings stored with each pack. Brotli above quality 9 costs
+    # seconds per megabyte for a few percent smaller bodies, so it is not the default.
+    pack_gzip_level: int = 9
+    pack_brotli_quality: int = 6
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        values = {}
+        for field in dataclasses.fields(cls):
+            raw = os.environ.get(field.name.upper())
+            if raw is None:
+                continue
+            if isinstance(field.default, bool):
+                values[field.name] = raw.lower() in ('1', 'true', 'yes')
+            elif isinstance(field.default, tuple):
+                values[field.name] = tuple(item.strip() for item in raw.split(',') if item.strip())
+            else:
+                values[field.name] = type(field.default)(raw)
+        return cls(**values)
+
+
+def create_storage(settings: Settings) -> Storage:
+    if settings.storage_backend == 'mongo':
+        # Imported here: motor and pymongo are the slowest imports, and a client created at
+        # import time would be shared by forked workers.
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        if not settings.mongo_url or not settings.db_name:
+            raise ValueError("MONGO_URL and DB_NAME must be set for the mongo storage backend")
+        options = {
+            "maxPoolSize": settings.mongo_max_pool_size,
+            "minPoolSize": settings.mongo_min_pool_size,
+            "connectTimeoutMS": settings.mongo_connect_timeout_ms,
+            "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+        }
+        if settings.mongo_socket_timeout_ms:
+            options["socketTimeoutMS"] = settings.mongo_socket_timeout_ms
+        if settings.mongo_compressors:
+            options["compressors"] = settings.mongo_compressors
+        client = AsyncIOMotorClient(settings.mongo_url, **options)
+        return MongoStorage(client, settings.db_name, settings.broker_entry_cache_size)
+    if settings.storage_backend == 'sqlite':
+        return SQLiteStorage(settings.sqlite_path, settings.broker_entry_cache_size)
+    if settings.storage_backend == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {settings.storage_backend}")
+
+
+# Each app keeps its settings, storage, caches and background tasks on app.state (see
+# create_app and init_app_state); storage is only created when the app starts, so importing this
+# module opens no connections.
+
+# Page size (and maximum page size) of GET /api/status.
+STATUS_PAGE_SIZE = 1000
+
+# GET /api/status/rollup: buckets returned when `from` is omitted.
+STATUS_ROLLUP_DEFAULT_BUCKETS = 24
+
+# Broker entries validated per batch while a pack upload streams in.
+PACK_VALIDATION_BATCH_SIZE = 500
+
+# The largest page of search hits.
+SEARCH_MAX_LIMIT = 100
+
+# Default page size of GET /api/broker-packs/{version}/brokers.
+BROKER_PAGE_DEFAULT_LIMIT = 100
+
+VERSIONED_PACK_CACHE_CONTROL = "public, max-age=31536000, immutable"
+LATEST_PACK_CACHE_CONTROL = "no-cache"
+
+# Fields kept on stored pack documents that are not part of the public BrokerPack.
+STORAGE_ONLY_PACK_FIELDS = ("_id", "etag", "encodings")
+
+# Content encodings precomputed at publish time, in order of preference.
+PACK_ENCODINGS = ("br", "gzip")
+
 
+async def require_ready(request: Request) -> None:
+    """Keep /api routes unavailable while warm-up (schema migrations included) is still running."""
+    warmup = request.app.state.warmup
+    if not warmup["ready"]:
+        raise HTTPException(status_code=503, detail=warmup["detail"], headers={"Retry-After": "1"})
 
-# Create the main app without a prefix
-app = FastAPI()
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", dependencies=[Depends(require_ready)])
+# The liveness and readiness probes, which answer during warm-up too.
+probe_router = APIRouter(prefix="/api")
 
 
 # Define Models
@@ -38,16 +260,26 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class StatusRollupBucket(BaseModel):
+    client_name: str
+    start: datetime
+    count: int
+
+class StatusRollup(BaseModel):
+    bucket: str
+    start: datetime
+    end: datetime
+    buckets: List[StatusRollupBucket]
+
+class StatusCheckStats(BaseModel):
+    documents: int
+    size_bytes: Optional[int] = None
+    index_size_bytes: Optional[int] = None
+    oldest: Optional[datetime] = None
+    retention_days: Optional[float] = None
+    pending_expiry: int
+    rollups: int
 
-class BrokerEntry(BaseModel):
-    id: str
-    name: str
-    opt_out_url: str
-    form_type: str = 'web'
-    required_fields: List[str] = []
-    verification_steps: Optional[str] = ''
-    response_time: Optional[str] = ''
-    follow_up_guidance: Optional[str] = ''
 
 class BrokerPack(BaseModel):
     version: str
@@ -56,137 +288,1433 @@ class BrokerPack(BaseModel):
     brokers: List[BrokerEntry]
     notes: Optional[str] = None
 
-class BrokerPackCreate(BaseModel):
-    version: str
-    brokers: List[BrokerEntry]
+class BrokerPackDiff(BaseModel):
+    from_version: str
+    to_version: str
+    created_at: str
+    updated_at: str
     notes: Optional[str] = None
-    updated_at: Optional[str] = None
+    added: List[BrokerEntry] = []
+    changed: List[BrokerEntry] = []
+    removed: List[str] = []
+    # Full id order of the target pack, only sent when applying the diff in place would not reproduce it.
+    order: Optional[List[str]] = None
+
+class ImportLineError(BaseModel):
+    line: int
+    detail: str
+
+class BrokerPackImportResult(BaseModel):
+    imported: int = 0
+    latest_version: Optional[str] = None
+    conflicts: List[str] = []
+    errors: List[ImportLineError] = []
+
+class BrokerPackValidationReport(BaseModel):
+    valid: bool
+    brokers: int
+    error_count: int
+    errors: List[dict]
+
+class BrokerSearchResult(BaseModel):
+    version: str
+    total: int
+    results: List[BrokerEntry]
+
+class BrokerLinkHealth(BaseModel):
+    url: str
+    broker_ids: List[str]
+    # Unset until the URL has been checked (or after its result expired).
+    ok: Optional[bool] = None
+    status: Optional[int] = None
+    error: Optional[str] = None
+    elapsed_ms: Optional[float] = None
+    checked_at: Optional[str] = None
+
+class LinkHealthReport(BaseModel):
+    version: str
+    running: bool
+    urls: int
+    checked: int
+    broken: int
+    links: List[BrokerLinkHealth]
+
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    route: Optional[str] = None
+    status: int
+    trigger: str
+    started_at: str
+    elapsed_ms: float
+    interval_ms: float
+    samples: int
+
+class RequestProfile(ProfileSummary):
+    threads: List[dict]
+
+class BrokerPage(BaseModel):
+    version: str
+    total: int
+    offset: int
+    limit: int
+    # Whole BrokerEntry objects, or only the requested fields of each.
+    brokers: List[dict]
+
+class LatestPackCache:
+    """In-process cache of the resolved latest pack and its serialized body."""
+
+    def __init__(self, revalidate_seconds: float):
+        self.revalidate_seconds = revalidate_seconds
+        self.version: Optional[str] = None
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.encodings: Dict[str, bytes] = {}
+        self.checked_at = 0.0
+
+    def is_fresh(self) -> bool:
+        if self.body is None:
+            return False
+        return time.monotonic() - self.checked_at < self.revalidate_seconds
+
+    def set(self, version: str, body: bytes, etag: str, encodings: Dict[str, bytes]) -> None:
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self.encodings = encodings
+        self.checked_at = time.monotonic()
+
+    def touch(self) -> None:
+        self.checked_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self.version = None
+        self.body = None
+        self.etag = None
+        self.encodings = {}
+        self.checked_at = 0.0
+
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one in-flight call.
+
+    The call runs as its own task, so a caller that disconnects does not cancel it for
+    the others; every caller gets its result or re-raises its exception.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: Dict[object, asyncio.Task] = {}
+
+    async def do(self, key, function):
+        task = self.calls.get(key)
+        if task is None:
+            SINGLE_FLIGHT_CALLS.labels(group=self.name, result="leader").inc()
+            task = asyncio.ensure_future(function())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self.forget(key, done))
+        else:
+            SINGLE_FLIGHT_CALLS.labels(group=self.name, result="coalesced").inc()
+        return await asyncio.shield(task)
+
+    def forget(self, key, task: asyncio.Task) -> None:
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Mark the exception retrieved in case every caller went away before it finished.
+        if not task.cancelled():
+            task.exception()
+
+
 
 @api_router.get("/broker-packs/latest", response_model=BrokerPack)
-async def get_latest_broker_pack():
-    latest_version = await get_latest_version()
+async def get_latest_broker_pack(
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    state = request.app.state
+    latest_pack_cache = state.latest_pack_cache
+    if latest_pack_cache.is_fresh():
+        record_cache("latest_pack", "hit")
+    else:
+        await refresh_latest_pack_cache(state)
+
+    matched = match_etag(if_none_match, latest_pack_cache.etag)
+    if matched:
+        return not_modified_response(matched, LATEST_PACK_CACHE_CONTROL)
+    return pack_response(
+        latest_pack_cache.body,
+        latest_pack_cache.etag,
+        LATEST_PACK_CACHE_CONTROL,
+        latest_pack_cache.encodings,
+        accept_encoding
+    )
+
+
+async def refresh_latest_pack_cache(state: State) -> None:
+    # Requests that find the cache stale at the same moment share one pointer read and pack load.
+    missing = await state.latest_pack_refreshes.do("latest", lambda: load_latest_pack(state))
+    if missing:
+        raise HTTPException(status_code=404, detail=missing)
+
+
+async def load_latest_pack(state: State) -> Optional[str]:
+    """Refresh the app's latest_pack_cache; return a 404 detail when there is nothing to serve."""
+    storage, latest_pack_cache = state.storage, state.latest_pack_cache
+    latest_version = await storage.packs.get_latest_version()
     if not latest_version:
-        raise HTTPException(status_code=404, detail="No broker packs available")
+        return "No broker packs available"
+
+    # Pointer unchanged since the last load: revalidate without re-reading the pack.
+    if latest_version == latest_pack_cache.version and latest_pack_cache.body is not None:
+        record_cache("latest_pack", "revalidated")
+        latest_pack_cache.touch()
+        return None
 
-    pack = await broker_packs_collection().find_one({"_id": latest_version})
+    record_cache("latest_pack", "miss")
+    pack = await storage.packs.get(latest_version)
     if not pack:
+        return "Broker pack not found"
+    body = serialize_pack(pack)
+    latest_pack_cache.set(
+        latest_version, body, pack.get("etag") or compute_etag(body), pack.get("encodings") or {}
+    )
+    return None
+
+
+@api_router.get("/broker-packs/diff", response_model=BrokerPackDiff)
+async def get_broker_pack_diff(
+    request: Request,
+    from_version: str = Query(..., alias="from"),
+    to_version: Optional[str] = Query(None, alias="to")
+):
+    storage, diff_cache = request.app.state.storage, request.app.state.diff_cache
+    if to_version:
+        # Both ends are write-once versions, so the diff between them never changes.
+        headers = {"Cache-Control": VERSIONED_PACK_CACHE_CONTROL}
+    else:
+        to_version = await storage.packs.get_latest_version()
+        if not to_version:
+            raise HTTPException(status_code=404, detail="No broker packs available")
+        headers = {"Cache-Control": LATEST_PACK_CACHE_CONTROL}
+
+    key = (from_version, to_version)
+    diff = diff_cache.get(key)
+    if diff is not None:
+        record_cache("pack_diff", "hit")
+        diff_cache.move_to_end(key)
+        return json_response(trusted_document(diff, BrokerPackDiff), headers)
+
+    stored = await storage.packs.get_diff(from_version, to_version)
+    if stored:
+        return json_response(trusted_document(stored, BrokerPackDiff), headers)
+
+    # Not one of the pairs precomputed on publish. Anyone may ask for any pair, so the diff
+    # is kept in a bounded in-memory cache rather than stored.
+    record_cache("pack_diff", "miss")
+    packs = await storage.packs.get_many([from_version, to_version])
+    packs_by_version = {pack["version"]: pack for pack in packs}
+    if from_version not in packs_by_version or to_version not in packs_by_version:
         raise HTTPException(status_code=404, detail="Broker pack not found")
-    return BrokerPack(**sanitize_pack(pack))
+
+    diff = compute_pack_diff(packs_by_version[from_version], packs_by_version[to_version])
+    diff_cache[key] = diff
+    while len(diff_cache) > request.app.state.settings.diff_cache_size:
+        diff_cache.popitem(last=False)
+    return json_response(trusted_document(diff, BrokerPackDiff), headers)
 
 
 @api_router.get("/broker-packs/{version}", response_model=BrokerPack)
-async def get_broker_pack(version: str):
-    pack = await broker_packs_collection().find_one({"_id": version})
+async def get_broker_pack(
+    request: Request,
+    version: str,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    state = request.app.state
+    pack_etags = state.pack_etags
+    etag = pack_etags.get(version)
+    if if_none_match:
+        record_cache("pack_etag", "miss" if etag is None else "hit")
+    if etag is None and if_none_match:
+        found, etag = await state.pack_lookups.do(("etag", version), lambda: state.storage.packs.get_etag(version))
+        if not found:
+            raise HTTPException(status_code=404, detail="Broker pack not found")
+        if etag:
+            pack_etags[version] = etag
+
+    matched = match_etag(if_none_match, etag)
+    if matched:
+        return not_modified_response(matched, VERSIONED_PACK_CACHE_CONTROL)
+
+    # Only pull the stored encodings over the wire when the client can use one of them,
+    # and in that case skip reassembling the brokers the encoded body already contains.
+    include_encodings = choose_encoding(accept_encoding, PACK_ENCODINGS) is not None
+    pack = await get_stored_pack(state, version, include_encodings)
     if not pack:
         raise HTTPException(status_code=404, detail="Broker pack not found")
-    return BrokerPack(**sanitize_pack(pack))
+
+    encodings = pack.get("encodings") or {}
+    if pack.get("etag") and choose_encoding(accept_encoding, encodings):
+        pack_etags[version] = pack["etag"]
+        return pack_response(None, pack["etag"], VERSIONED_PACK_CACHE_CONTROL, encodings, accept_encoding)
+    if include_encodings:
+        pack = await get_stored_pack(state, version, False)
+        if not pack:
+            raise HTTPException(status_code=404, detail="Broker pack not found")
+
+    body = serialize_pack(pack)
+    etag = pack.get("etag") or compute_etag(body)
+    pack_etags[version] = etag
+    return pack_response(body, etag, VERSIONED_PACK_CACHE_CONTROL, encodings, accept_encoding)
+
+
+async def get_stored_pack(state: State, version: str, include_encodings: bool) -> Optional[dict]:
+    """Load a pack once for all concurrent requests wanting the same version and projection.
+
+    With encodings the brokers are not reassembled, since the encoded bodies contain them.
+    The shared document is read-only to callers.
+    """
+    return await state.pack_lookups.do(
+        (version, include_encodings),
+        lambda: state.storage.packs.get(
+            version, include_encodings=include_encodings, include_brokers=not include_encodings
+        )
+    )
+
+
+@api_router.get("/broker-packs/{version}/search", response_model=BrokerSearchResult)
+async def search_broker_pack(
+    request: Request,
+    version: str,
+    q: Optional[str] = None,
+    form_type: Optional[str] = None,
+    required_field: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT)
+):
+    if version == "latest":
+        version = await request.app.state.storage.packs.get_latest_version()
+        if not version:
+            raise HTTPException(status_code=404, detail="No broker packs available")
+
+    index = await get_search_index(request.app.state, version)
+    total, results = index.search(q, form_type, required_field, limit)
+    # The index holds BrokerEntry-normalized dicts, so they are encoded as they are.
+    return json_response({"version": version, "total": total, "results": results})
+
+
+@api_router.get("/broker-packs/{version}/brokers", response_model=BrokerPage)
+async def get_broker_page(
+    request: Request,
+    version: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(BROKER_PAGE_DEFAULT_LIMIT, ge=1),
+    fields: Optional[str] = None
+):
+    """A page of a pack's brokers, optionally cut down to a comma-separated list of fields."""
+    max_limit = request.app.state.settings.broker_page_max_limit
+    if limit > max_limit:
+        raise HTTPException(status_code=400, detail=f"limit must be at most {max_limit}")
+
+    selected = None
+    if fields:
+        selected = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+        unknown = [field for field in selected if field not in BrokerEntry.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown broker fields: {', '.join(unknown)}")
+
+    storage = request.app.state.storage
+    cache_control = VERSIONED_PACK_CACHE_CONTROL
+    if version == "latest":
+        version = await storage.packs.get_latest_version()
+        if not version:
+            raise HTTPException(status_code=404, detail="No broker packs available")
+        cache_control = LATEST_PACK_CACHE_CONTROL
+
+    page = await storage.packs.get_broker_page(version, offset, limit, selected)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Broker pack not found")
+    total, brokers = page
+    # Stored entries were normalized through BrokerEntry on publish, so they are encoded as they are.
+    with SERIALIZATION_LATENCY.labels(kind="broker_page").time():
+        return json_response(
+            {"version": version, "total": total, "offset": offset, "limit": limit, "brokers": brokers},
+            {"Cache-Control": cache_control}
+        )
+
+
+@api_router.get("/broker-packs/{version}/link-health", response_model=LinkHealthReport)
+async def get_link_health(request: Request, version: str, broken_only: bool = False):
+    """Cached check results for each distinct opt_out_url of a pack, with the brokers using it."""
+    version, brokers = await get_link_check_brokers(request.app.state.storage, version)
+    return json_response(link_health_report(request.app.state, version, brokers, broken_only))
+
+
+@api_router.post("/admin/broker-packs/{version}/link-health", response_model=LinkHealthReport)
+async def check_link_health(
+    request: Request, version: str, wait: bool = False, authorization: Optional[str] = Header(None)
+):
+    """Start checking a pack's opt_out_urls (202), or with wait=true report once the run is done."""
+    state = request.app.state
+    verify_admin_token(state.settings, authorization)
+    version, brokers = await get_link_check_brokers(state.storage, version)
+    # One check run per pack version at a time; URLs shared between versions are cached in link_checker.
+    run = state.link_checks.get(version)
+    if run is None:
+        run = asyncio.create_task(state.link_checker.check_all(broker["opt_out_url"] for broker in brokers))
+        state.link_checks[version] = run
+        run.add_done_callback(lambda task: finish_link_check(state.link_checks, version, task))
+    if wait:
+        await asyncio.shield(run)
+    report = link_health_report(state, version, brokers, broken_only=False)
+    return Response(
+        content=dump_json(report), media_type="application/json", status_code=202 if report["running"] else 200
+    )
+
+
+UNCHECKED_LINK = {"ok": None, "status": None, "error": None, "elapsed_ms": None, "checked_at": None}
+
+
+def finish_link_check(link_checks: Dict[str, asyncio.Task], version: str, task: asyncio.Task) -> None:
+    link_checks.pop(version, None)
+    if not task.cancelled() and task.exception():
+        logger.error("Link check of pack %s failed", version, exc_info=task.exception())
+
+
+async def get_link_check_brokers(storage: Storage, version: str) -> Tuple[str, List[dict]]:
+    if version == "latest":
+        version = await storage.packs.get_latest_version()
+        if not version:
+            raise HTTPException(status_code=404, detail="No broker packs available")
+    brokers = await storage.packs.get_brokers(version)
+    if brokers is None:
+        raise HTTPException(status_code=404, detail="Broker pack not found")
+    return version, brokers
+
+
+def link_health_report(state: State, version: str, brokers: List[dict], broken_only: bool) -> dict:
+    broker_ids: Dict[str, List[str]] = {}
+    for broker in brokers:
+        broker_ids.setdefault(broker["opt_out_url"], []).append(broker["id"])
+
+    links = []
+    checked = broken = 0
+    for url, ids in broker_ids.items():
+        result = state.link_checker.cached(url)
+        if result is not None:
+            checked += 1
+            broken += not result["ok"]
+        if broken_only and (result is None or result["ok"]):
+            continue
+        links.append({"url": url, "broker_ids": ids, **(result or UNCHECKED_LINK)})
+    return {
+        "version": version,
+        "running": version in state.link_checks,
+        "urls": len(broker_ids),
+        "checked": checked,
+        "broken": broken,
+        "links": links,
+    }
 
 
 @api_router.post("/broker-packs", response_model=BrokerPack)
-async def create_broker_pack(payload: BrokerPackCreate, authorization: Optional[str] = Header(None)):
-    verify_admin_token(authorization)
+async def create_broker_pack(request: Request, authorization: Optional[str] = Header(None)):
+    """Publish a pack. The BrokerPackCreate body is parsed and validated as it streams in."""
+    state = request.app.state
+    settings, storage = state.settings, state.storage
+    verify_admin_token(settings, authorization)
+
+    validator = new_pack_validator(settings)
+    fields, brokers = await read_pack_upload(request, validator, keep_entries=True)
+    if validator.error_count:
+        raise HTTPException(status_code=422, detail=validator.errors)
 
-    existing = await broker_packs_collection().find_one({"_id": payload.version})
-    if existing:
+    if await storage.packs.exists(fields["version"]):
         raise HTTPException(status_code=409, detail="Broker pack version already exists")
 
     created_at = datetime.utcnow().isoformat()
-    updated_at = payload.updated_at or created_at
+    # Serializing and compressing a large pack takes a while; keep the event loop serving meanwhile.
+    pack_dict = await run_in_threadpool(build_pack_document, {**fields, "brokers": brokers}, created_at, settings)
 
-    pack_dict = payload.dict()
-    pack_dict.update({
-        "_id": payload.version,
-        "created_at": created_at,
-        "updated_at": updated_at
-    })
+    recent_packs = await storage.packs.recent(settings.broker_pack_diff_history)
 
-    await broker_packs_collection().insert_one(pack_dict)
-    await broker_pack_meta_collection().update_one(
-        {"_id": "latest"},
-        {"$set": {"version": payload.version, "updated_at": created_at}},
-        upsert=True
-    )
+    await storage.packs.insert(pack_dict)
+    await storage.packs.set_latest_version(pack_dict["version"], created_at)
+    state.latest_pack_cache.invalidate()
+
+    for previous in recent_packs:
+        await storage.packs.save_diff(await run_in_threadpool(compute_pack_diff, previous, pack_dict))
 
     return BrokerPack(**sanitize_pack(pack_dict))
 
 
-def verify_admin_token(authorization: Optional[str]) -> None:
-    if not ADMIN_TOKEN:
+@api_router.post("/broker-packs/validate", response_model=BrokerPackValidationReport)
+async def validate_broker_pack(request: Request, authorization: Optional[str] = Header(None)):
+    """Check a pack upload without storing it; memory stays flat however many brokers it has."""
+    settings = request.app.state.settings
+    verify_admin_token(settings, authorization)
+
+    validator = new_pack_validator(settings)
+    await read_pack_upload(request, validator, keep_entries=False)
+    return {
+        "valid": validator.error_count == 0,
+        "brokers": validator.entries_checked,
+        "error_count": validator.error_count,
+        "errors": validator.errors,
+    }
+
+
+def new_pack_validator(settings: Settings) -> PackValidator:
+    return PackValidator(BrokerEntry, settings.broker_form_types, settings.pack_validation_max_errors)
+
+
+async def read_pack_upload(request: Request, validator: PackValidator, keep_entries: bool):
+    parser = PackStreamParser(request.stream(), request.app.state.settings.pack_upload_max_value_bytes)
+    try:
+        return await read_pack(parser, validator, BrokerPackCreate, PACK_VALIDATION_BATCH_SIZE, keep_entries)
+    except PackStreamError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
+@api_router.post("/broker-packs/import", response_model=BrokerPackImportResult)
+async def import_broker_packs(
+    request: Request,
+    set_latest: bool = True,
+    authorization: Optional[str] = Header(None)
+):
+    """Import many pack versions from an NDJSON body, one BrokerPackCreate per line.
+
+    Lines are parsed as they arrive and written in batches; versions that already exist
+    are skipped and reported, as are lines that fail validation or exceed
+    import_max_line_bytes. With set_latest, the latest pointer moves once, to the last
+    imported line.
+    """
+    state = request.app.state
+    settings, storage = state.settings, state.storage
+    verify_admin_token(settings, authorization)
+
+    result = BrokerPackImportResult()
+    batch: List[dict] = []
+    seen: Set[str] = set()
+
+    async def flush() -> None:
+        versions = [fields["version"] for fields in batch]
+        existing = await storage.packs.existing_versions(versions)
+        created_at = datetime.utcnow()
+        documents = []
+        for offset, fields in enumerate(batch):
+            if fields["version"] in existing:
+                result.conflicts.append(fields["version"])
+                continue
+            # Keep stream order in created_at, which recent() and the latest fallback sort on.
+            pack_created_at = (created_at + timedelta(microseconds=offset)).isoformat()
+            documents.append(await run_in_threadpool(build_pack_document, fields, pack_created_at, settings))
+        if documents:
+            await storage.packs.insert_many(documents)
+            result.imported += len(documents)
+            result.latest_version = documents[-1]["version"]
+        batch.clear()
+
+    line_number = 0
+    async for line in iter_lines(request.stream(), settings.import_max_line_bytes):
+        line_number += 1
+        if line is None:
+            detail = f"Line exceeds {settings.import_max_line_bytes} bytes"
+            result.errors.append(ImportLineError(line=line_number, detail=detail))
+            continue
+        if not line.strip():
+            continue
+        try:
+            payload = BrokerPackCreate.model_validate_json(line)
+        except ValidationError as error:
+            result.errors.append(ImportLineError(line=line_number, detail=str(error)))
+            continue
+        if payload.version in seen:
+            result.errors.append(ImportLineError(line=line_number, detail="Duplicate version in import"))
+            continue
+        validator = new_pack_validator(settings)
+        brokers = validator.check_batch(0, [broker.dict() for broker in payload.brokers])
+        if validator.error_count:
+            detail = "; ".join(f"{'.'.join(map(str, error['loc'][1:]))}: {error['msg']}" for error in validator.errors)
+            result.errors.append(ImportLineError(line=line_number, detail=detail))
+            continue
+        seen.add(payload.version)
+        batch.append({**payload.dict(), "brokers": brokers})
+        if len(batch) >= settings.import_batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    if set_latest and result.latest_version:
+        await storage.packs.set_latest_version(result.latest_version, datetime.utcnow().isoformat())
+        state.latest_pack_cache.invalidate()
+    return result
+
+
+async def iter_lines(chunks, max_line_bytes: int):
+    """Split a byte stream into lines without holding more than one partial line.
+
+    Only each new chunk is searched for newlines, and a line's parts are joined once, so a
+    long line spread over many chunks costs time linear in its length. A line longer than
+    max_line_bytes is read through and dropped as it arrives, and yielded as None.
+    """
+    parts: List[bytes] = []
+    size = 0
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            size += (len(chunk) if end < 0 else end) - start
+            if size > max_line_bytes and not oversized:
+                oversized = True
+                parts = []
+            if end < 0:
+                break
+            if oversized:
+                yield None
+            else:
+                parts.append(chunk[start:end])
+                yield b"".join(parts)
+            parts = []
+            size = 0
+            oversized = False
+            start = end + 1
+        if start < len(chunk) and not oversized:
+            parts.append(chunk[start:])
+    if oversized:
+        yield None
+    elif parts:
+        yield b"".join(parts)
+
+
+def build_pack_document(fields: dict, created_at: str, settings: Settings) -> dict:
+    """Stored document for validated BrokerPackCreate fields, with its ETag and encodings."""
+    pack_dict = {**fields}
+    pack_dict.update({
+        "created_at": created_at,
+        "updated_at": fields.get("updated_at") or created_at
+    })
+    body = serialize_pack(pack_dict)
+    pack_dict["etag"] = compute_etag(body)
+    pack_dict["encodings"] = compress_pack_body(body, settings.pack_gzip_level, settings.pack_brotli_quality)
+    return pack_dict
+
+
+def verify_admin_token(settings: Settings, authorization: Optional[str]) -> None:
+    if not settings.admin_token:
         raise HTTPException(status_code=500, detail="Admin token not configured")
 
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     token = authorization.split(" ", 1)[1]
-    if token != ADMIN_TOKEN:
+    if token != settings.admin_token:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
+def is_admin(settings: Settings, authorization: Optional[str]) -> bool:
+    try:
+        verify_admin_token(settings, authorization)
+    except HTTPException:
+        return False
+    return True
+
+
 def sanitize_pack(pack: dict) -> dict:
     cleaned = {**pack}
-    cleaned.pop("_id", None)
+    for field in STORAGE_ONLY_PACK_FIELDS:
+        cleaned.pop(field, None)
     return cleaned
 
 
-def broker_packs_collection():
-    return db.broker_packs
+def serialize_pack(pack: dict) -> bytes:
+    with SERIALIZATION_LATENCY.labels(kind="broker_pack").time():
+        return dump_json(trusted_document(pack, BrokerPack))
+
+
+def trusted_document(document: dict, model) -> dict:
+    """Project a stored document onto a model's public fields without re-validating it.
+
+    Only for data that was validated when it was written; field order follows the model
+    so the bytes match what the model itself would produce.
+    """
+    return {
+        name: document[name] if name in document else field.get_default(call_default_factory=True)
+        for name, field in model.model_fields.items()
+    }
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dump_json(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=json_default).encode()
+
+
+def json_response(value, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=dump_json(value), media_type="application/json", headers=headers)
+
 
+def compute_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest() + '"'
 
-def broker_pack_meta_collection():
-    return db.broker_pack_meta
 
+def compress_pack_body(body: bytes, gzip_level: int, brotli_quality: int) -> Dict[str, bytes]:
+    encodings = {"gzip": gzip.compress(body, compresslevel=gzip_level, mtime=0)}
+    if brotli is not None:
+        encodings["br"] = brotli.compress(body, quality=brotli_quality)
+    return encodings
 
-async def get_latest_version() -> Optional[str]:
-    meta = await broker_pack_meta_collection().find_one({"_id": "latest"})
-    if meta and meta.get("version"):
-        return meta["version"]
 
-    latest = (
-        await broker_packs_collection()
-        .find()
-        .sort("created_at", -1)
-        .limit(1)
-        .to_list(1)
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    # Each content encoding is a distinct representation and needs its own strong ETag.
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def match_etag(if_none_match: Optional[str], etag: Optional[str]) -> Optional[str]:
+    """Return the If-None-Match entry that matches any representation of etag."""
+    if not if_none_match or not etag:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # If-None-Match uses weak comparison, so a W/ prefix still matches.
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return candidate
+        for encoding in PACK_ENCODINGS:
+            if candidate == representation_etag(etag, encoding):
+                return candidate
+    return None
+
+
+def choose_encoding(accept_encoding: Optional[str], available) -> Optional[str]:
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in PACK_ENCODINGS:
+        if encoding not in available:
+            continue
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def pack_response(
+    body: Optional[bytes],
+    etag: str,
+    cache_control: str,
+    encodings: Optional[Dict[str, bytes]] = None,
+    accept_encoding: Optional[str] = None
+) -> Response:
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    encoding = choose_encoding(accept_encoding, encodings or {})
+    if encoding:
+        body = encodings[encoding]
+        headers["Content-Encoding"] = encoding
+    headers["ETag"] = representation_etag(etag, encoding)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def not_modified_response(etag: str, cache_control: str) -> Response:
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
     )
-    if not latest:
+
+
+def compute_pack_diff(old_pack: dict, new_pack: dict) -> dict:
+    old_entries = {entry["id"]: entry for entry in (BrokerEntry(**b).dict() for b in old_pack["brokers"])}
+    new_entries = [BrokerEntry(**b).dict() for b in new_pack["brokers"]]
+    new_ids = {entry["id"] for entry in new_entries}
+
+    added = [entry for entry in new_entries if entry["id"] not in old_entries]
+    changed = [
+        entry for entry in new_entries
+        if entry["id"] in old_entries and old_entries[entry["id"]] != entry
+    ]
+    removed = [broker_id for broker_id in old_entries if broker_id not in new_ids]
+
+    applied_order = [broker_id for broker_id in old_entries if broker_id in new_ids]
+    applied_order += [entry["id"] for entry in added]
+    new_order = [entry["id"] for entry in new_entries]
+
+    return {
+        "from_version": old_pack["version"],
+        "to_version": new_pack["version"],
+        "created_at": new_pack["created_at"],
+        "updated_at": new_pack["updated_at"],
+        "notes": new_pack.get("notes"),
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "order": None if applied_order == new_order else new_order,
+    }
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class BrokerSearchIndex:
+    """Inverted index over the ids, names and required fields of one pack's brokers."""
+
+    # Score of a token hit per field; an exact token match counts double a prefix match.
+    FIELD_WEIGHTS = {"id": 3.0, "name": 2.0, "required_fields": 1.0}
+    # Added when the whole query is a broker's id.
+    EXACT_ID_BONUS = 10.0
+
+    def __init__(self, brokers: List[dict]):
+        self.brokers = brokers
+        postings: Dict[str, Dict[int, float]] = {}
+        self.by_id: Dict[str, List[int]] = {}
+        # Filter position sets are dicts with None values: ordered by position, with O(1) membership.
+        self.by_form_type: Dict[str, Dict[int, None]] = {}
+        self.by_required_field: Dict[str, Dict[int, None]] = {}
+
+        for position, broker in enumerate(brokers):
+            broker_tokens: Dict[str, float] = {}
+            for field, weight in self.FIELD_WEIGHTS.items():
+                value = broker.get(field) or ""
+                text = " ".join(value) if isinstance(value, list) else value
+                for token in tokenize(text):
+                    broker_tokens[token] = max(broker_tokens.get(token, 0.0), weight)
+            for token, weight in broker_tokens.items():
+                postings.setdefault(token, {})[position] = weight
+
+            self.by_id.setdefault(broker["id"].lower(), []).append(position)
+            self.by_form_type.setdefault(broker["form_type"].lower(), {})[position] = None
+            for required_field in broker["required_fields"]:
+                self.by_required_field.setdefault(required_field.lower(), {})[position] = None
+
+        # What a query token adds to each broker it matches, for every prefix of every term: the
+        # best weight among the broker's terms it starts, doubled where it is the whole term. A
+        # prefix of a single longer term shares that term's postings rather than a copy.
+        terms = sorted(postings)
+        self.token_scores: Dict[str, Dict[int, float]] = {}
+        for term in terms:
+            for end in range(1, len(term) + 1):
+                prefix = term[:end]
+                if prefix in self.token_scores:
+                    continue
+                first = bisect.bisect_left(terms, prefix)
+                last = bisect.bisect_left(terms, prefix + "\uffff", first)
+                if last - first == 1 and prefix != term:
+                    self.token_scores[prefix] = postings[term]
+                    continue
+                scores: Dict[int, float] = {}
+                for matching_term in terms[first:last]:
+                    boost = 2.0 if matching_term == prefix else 1.0
+                    for position, weight in postings[matching_term].items():
+                        if weight * boost > scores.get(position, 0.0):
+                            scores[position] = weight * boost
+                self.token_scores[prefix] = scores
+
+    def filter_positions(self, form_type: Optional[str], required_field: Optional[str]) -> Optional[Dict[int, None]]:
+        """Positions matching every given filter, in order, or None when no filter is given."""
+        filters = []
+        if form_type:
+            filters.append(self.by_form_type.get(form_type.lower(), {}))
+        if required_field:
+            filters.append(self.by_required_field.get(required_field.lower(), {}))
+        if not filters:
+            return None
+        filters.sort(key=len)
+        positions = filters[0]
+        for other in filters[1:]:
+            positions = {position: None for position in positions if position in other}
+        return positions
+
+    def search(
+        self,
+        q: Optional[str],
+        form_type: Optional[str] = None,
+        required_field: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[int, List[dict]]:
+        allowed = self.filter_positions(form_type, required_field)
+        query_tokens = tokenize(q or "")
+
+        if not query_tokens:
+            if allowed is None:
+                return len(self.brokers), self.brokers[:limit]
+            return len(allowed), [self.brokers[position] for position in islice(allowed, limit)]
+
+        # Every query token must match some field token by prefix; scores add up across tokens.
+        token_scores = [self.token_scores.get(token) for token in query_tokens]
+        if not all(token_scores):
+            return 0, []
+        if allowed is None and len(token_scores) == 1:
+            scores = token_scores[0]
+        else:
+            # Intersect from the smallest position set, so the work is bounded by the rarest token.
+            position_sets = sorted(token_scores if allowed is None else [*token_scores, allowed], key=len)
+            matching = position_sets[0].keys()
+            for positions in position_sets[1:]:
+                matching = positions.keys() & matching
+            candidates = list(matching)
+            totals = map(token_scores[0].__getitem__, candidates)
+            for scores_by_position in token_scores[1:]:
+                totals = map(operator.add, totals, map(scores_by_position.__getitem__, candidates))
+            scores = dict(zip(candidates, totals))
+        if not scores:
+            return 0, []
+
+        exact_ids = [position for position in self.by_id.get(q.strip().lower(), ()) if position in scores]
+        if exact_ids:
+            # scores may be one of the index's own dicts; the bonus goes on a copy.
+            scores = dict(scores)
+            for position in exact_ids:
+                scores[position] += self.EXACT_ID_BONUS
+
+        # Highest score first, then lowest position.
+        ranked = heapq.nlargest(limit, zip(scores.values(), map(operator.neg, scores)))
+        positions = [-position for _, position in ranked]
+        return len(scores), [self.brokers[position] for position in positions]
+
+
+async def get_search_index(state: State, version: str) -> BrokerSearchIndex:
+    index = state.search_indexes.get(version)
+    if index is not None:
+        record_cache("search_index", "hit")
+        state.search_indexes.move_to_end(version)
+        return index
+
+    record_cache("search_index", "miss")
+    index = await state.search_index_builds.do(version, lambda: build_search_index(state, version))
+    if index is None:
+        raise HTTPException(status_code=404, detail="Broker pack not found")
+    return index
+
+
+async def build_search_index(state: State, version: str) -> Optional[BrokerSearchIndex]:
+    stored_brokers = await state.storage.packs.get_brokers(version)
+    if stored_brokers is None:
         return None
-    return latest[0].get("version")
+
+    brokers = [BrokerEntry(**broker).dict() for broker in stored_brokers]
+    index = await run_in_threadpool(BrokerSearchIndex, brokers)
+    search_indexes = state.search_indexes
+    search_indexes[version] = index
+    while len(search_indexes) > state.settings.search_index_cache_size:
+        search_indexes.popitem(last=False)
+    return index
 
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "Hello World"}
 
+@probe_router.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@probe_router.get("/readyz")
+async def readyz(request: Request):
+    state = request.app.state
+    if not state.warmup["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", "detail": state.warmup["detail"]})
+    try:
+        await asyncio.wait_for(state.storage.ping(), state.settings.readiness_ping_timeout_seconds)
+    except Exception as error:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "detail": str(error)})
+    return {"status": "ready", "latest_version": state.latest_pack_cache.version}
+
 @api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
+async def create_status_check(request: Request, input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    status_write_buffer = request.app.state.status_write_buffer
+    if status_write_buffer:
+        await status_write_buffer.add(status_obj.dict())
+    else:
+        await request.app.state.storage.status_checks.insert_one(status_obj.dict())
     return status_obj
 
+@api_router.post("/status/batch", response_model=List[StatusCheck])
+async def create_status_checks(request: Request, inputs: List[StatusCheckCreate]):
+    max_items = request.app.state.settings.status_batch_max_items
+    if len(inputs) > max_items:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {max_items} items")
+
+    status_objs = [StatusCheck(**item.dict()) for item in inputs]
+    await request.app.state.storage.status_checks.insert_many([status_obj.dict() for status_obj in status_objs])
+    return status_objs
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
-
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def get_status_checks(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    format: Optional[str] = None
+):
+    storage = request.app.state.storage
+    after = decode_status_cursor(cursor)
+
+    if format == "ndjson":
+        # Stream the whole (optionally limited) history straight off the storage cursor.
+        documents = storage.status_checks.stream(after, limit)
+        return StreamingResponse(stream_status_checks(documents), media_type="application/x-ndjson")
+    if format is not None:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+
+    limit = min(limit or STATUS_PAGE_SIZE, STATUS_PAGE_SIZE)
+    status_checks = await storage.status_checks.page(after, limit)
+    headers = {}
+    if len(status_checks) == limit:
+        headers["X-Next-Cursor"] = encode_status_cursor(status_checks[-1])
+    with SERIALIZATION_LATENCY.labels(kind="status_checks").time():
+        documents = [trusted_document(status_check, StatusCheck) for status_check in status_checks]
+        return json_response(documents, headers)
+
+
+@api_router.get("/status/rollup", response_model=StatusRollup)
+async def get_status_rollup(
+    request: Request,
+    client: Optional[str] = None,
+    bucket: str = "hour",
+    from_time: Optional[datetime] = Query(None, alias="from"),
+    to_time: Optional[datetime] = Query(None, alias="to")
+):
+    """Per-client status check counts from the precomputed rollups, for buckets starting in [from, to)."""
+    if bucket not in ROLLUP_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(ROLLUP_BUCKETS)}")
+    width = ROLLUP_BUCKETS[bucket]
+
+    end = naive_utc(to_time) if to_time else datetime.utcnow()
+    if from_time:
+        start = bucket_start(naive_utc(from_time), bucket)
+    else:
+        start = bucket_start(end, bucket) - (STATUS_ROLLUP_DEFAULT_BUCKETS - 1) * width
+    if end <= start:
+        raise HTTPException(status_code=400, detail="to must be after from")
+    max_buckets = request.app.state.settings.status_rollup_max_buckets
+    if (end - start) / width > max_buckets:
+        raise HTTPException(status_code=400, detail=f"Range spans more than {max_buckets} {bucket} buckets")
+
+    buckets = await request.app.state.storage.status_checks.rollups(bucket, client, start, end)
+    return json_response({"bucket": bucket, "start": start, "end": end, "buckets": buckets})
+
+
+@api_router.get("/admin/status-checks/stats", response_model=StatusCheckStats)
+async def get_status_check_stats(request: Request, authorization: Optional[str] = Header(None)):
+    """Size of the raw status check collection and how many checks are past retention."""
+    settings = request.app.state.settings
+    verify_admin_token(settings, authorization)
+    cutoff = retention_cutoff(settings.status_retention_days)
+    stats = await request.app.state.storage.status_checks.stats(cutoff)
+    stats["retention_days"] = settings.status_retention_days or None
+    return json_response(stats)
+
+
+@api_router.get("/admin/profiles", response_model=List[ProfileSummary])
+async def list_profiles(request: Request, authorization: Optional[str] = Header(None)):
+    """The profiles this process has kept, newest first, without their call trees."""
+    verify_admin_token(request.app.state.settings, authorization)
+    return json_response(request.app.state.profile_store.summaries())
+
+
+@api_router.get("/admin/profiles/{profile_id}", response_model=RequestProfile)
+async def get_profile(
+    request: Request,
+    profile_id: str,
+    format: str = "json",
+    authorization: Optional[str] = Header(None)
+):
+    """A request's sampled call trees; format=folded gives collapsed stacks for flame graph tools."""
+    verify_admin_token(request.app.state.settings, authorization)
+    if format not in ("json", "folded"):
+        raise HTTPException(status_code=400, detail="format must be one of json, folded")
+    profile = request.app.state.profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return Response(content=folded_stacks(profile), media_type="text/plain")
+    return json_response(profile)
+
+
+def folded_stacks(profile: dict) -> str:
+    """One "thread;outer;...;inner samples" line per stack that had samples of its own."""
+    lines = []
+
+    def walk(nodes: List[dict], path: str) -> None:
+        for node in nodes:
+            stack = f"{path};{node['function']}"
+            if node["self_samples"]:
+                lines.append(f"{stack} {node['self_samples']}")
+            walk(node["children"], stack)
+
+    for thread in profile["threads"]:
+        walk(thread["tree"], thread["thread"])
+    return "\n".join(lines) + "\n"
+
+
+def retention_cutoff(days: float) -> Optional[datetime]:
+    return datetime.utcnow() - timedelta(days=days) if days else None
+
+
+async def expire_status_data(storage: Storage, settings: Settings) -> None:
+    cutoff = retention_cutoff(settings.status_retention_days)
+    if cutoff:
+        expired = await storage.status_checks.expire(cutoff)
+        if expired:
+            logger.info("Expired %d status checks older than %s", expired, cutoff.isoformat())
+    cutoff = retention_cutoff(settings.status_minute_rollup_retention_days)
+    if cutoff:
+        expired = await storage.status_checks.expire_rollups("minute", cutoff)
+        if expired:
+            logger.info("Expired %d minute rollups older than %s", expired, cutoff.isoformat())
+
+
+async def run_status_retention(storage: Storage, settings: Settings) -> None:
+    while True:
+        try:
+            await expire_status_data(storage, settings)
+        except Exception:
+            logger.exception("Status check retention pass failed")
+        await asyncio.sleep(settings.status_retention_interval_seconds)
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Status timestamps are stored as naive UTC; convert aware query parameters to match."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class StatusWriteBuffer:
+    """Write-behind buffer that flushes status checks on a size or time threshold.
+
+    A batch leaves the buffer only once insert succeeded; a failed or cancelled flush puts it
+    back in front of the pending checks for the next flush to retry (a batch that was partly
+    written before failing may then be written twice).
+    """
+
+    def __init__(self, insert, max_items: int, max_delay_seconds: float):
+        self.insert = insert
+        self.max_items = max_items
+        self.max_delay_seconds = max_delay_seconds
+        self.pending: List[dict] = []
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = asyncio.Event()
+
+    async def add(self, document: dict) -> None:
+        self.pending.append(document)
+        if len(self.pending) >= self.max_items:
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Write the pending checks; False if they are still pending."""
+        if not self.pending:
+            return True
+        documents, self.pending = self.pending, []
+        try:
+            await self.insert(documents)
+        except asyncio.CancelledError:
+            self.pending[:0] = documents
+            raise
+        except Exception:
+            self.pending[:0] = documents
+            logger.exception("Failed to flush %d buffered status checks; will retry", len(documents))
+            return False
+        return True
+
+    async def run(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.max_delay_seconds)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self) -> None:
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Let a flush in progress finish, then write what is left."""
+        self.stopping.set()
+        if self.task:
+            await self.task
+            self.task = None
+        if not await self.flush():
+            logger.error("Dropping %d buffered status checks that could not be written", len(self.pending))
+
+
+
+def encode_status_cursor(status_check: dict) -> str:
+    raw = f"{status_check['timestamp'].isoformat()}|{status_check['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_status_cursor(cursor: Optional[str]) -> Optional[StatusCursor]:
+    if not cursor:
+        return None
+    try:
+        raw_timestamp, status_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        # Stored timestamps are naive UTC; a hand-made cursor may carry an offset.
+        return naive_utc(datetime.fromisoformat(raw_timestamp)), status_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def stream_status_checks(documents):
+    async for status_check in documents:
+        yield dump_json(trusted_document(status_check, StatusCheck)) + b"\n"
+
+def rate_limit_budget(method: str, path: str) -> Optional[str]:
+    if not path.startswith("/api/") or path in ("/api/healthz", "/api/readyz"):
+        return None
+    if path.startswith("/api/admin/") or (method == "POST" and path.startswith("/api/broker-packs")):
+        return "admin"
+    return "public"
+
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# Bump SCHEMA_VERSION whenever the indexes declared in storage.py change so deployments
+# record what they applied.
+# 2: broker entries move out of pack documents into the content-addressed entry store.
+# 3: status check rollups, backfilled from the existing status checks.
+SCHEMA_VERSION = 3
+
+
+# How long the schema migration lease outlives its holder's last renewal.
+SCHEMA_MIGRATION_LEASE = timedelta(seconds=60)
+
+
+class MigrationInProgress(Exception):
+    """Another server holds the schema migration lease."""
+
+
+async def renew_migration_lease(storage: Storage, owner: str):
+    while True:
+        await asyncio.sleep(SCHEMA_MIGRATION_LEASE.total_seconds() / 3)
+        try:
+            if not await storage.claim_migration(owner, SCHEMA_MIGRATION_LEASE):
+                logger.warning("Lost the schema migration lease to another server")
+        except Exception:
+            logger.warning("Could not renew the schema migration lease", exc_info=True)
+
+
+async def apply_schema_migrations(storage: Storage):
+    created = await storage.ensure_indexes()
+    for index in created:
+        logger.info("Created index %s", index)
+
+    current_version = await storage.get_schema_version()
+    if current_version > SCHEMA_VERSION:
+        logger.warning(
+            "Database schema version %d is newer than this server's %d", current_version, SCHEMA_VERSION
+        )
+        return
+    if current_version == SCHEMA_VERSION:
+        return
+
+    # Backfills must not run twice at once (two rollup rebuilds double-count), so only the
+    # holder of the lease migrates; other servers fail warm-up and retry until it is done.
+    owner = uuid.uuid4().hex
+    if not await storage.claim_migration(owner, SCHEMA_MIGRATION_LEASE):
+        raise MigrationInProgress("Another server is applying schema migrations")
+    renewal = asyncio.create_task(renew_migration_lease(storage, owner))
+    try:
+        # The previous holder may have finished between the read above and the claim.
+        current_version = await storage.get_schema_version()
+        if current_version < 2:
+            migrated = await storage.packs.deduplicate_legacy_packs()
+            if migrated:
+                logger.info("Moved brokers of %d packs into the broker entry store", migrated)
+        if current_version < 3:
+            counted = await storage.status_checks.rebuild_rollups()
+            if counted:
+                logger.info("Built status rollups from %d existing status checks", counted)
+        if current_version < SCHEMA_VERSION:
+            await storage.set_schema_version(SCHEMA_VERSION, datetime.utcnow().isoformat())
+            logger.info("Applied schema version %d (was %d)", SCHEMA_VERSION, current_version)
+    finally:
+        renewal.cancel()
+        await storage.release_migration(owner)
+
+
+async def warm_up(state: State) -> None:
+    """Run everything startup needs from storage, retrying with backoff until it all succeeds."""
+    storage, settings = state.storage, state.settings
+    delay = 0.5
+    while True:
+        try:
+            await storage.ping()
+            await apply_schema_migrations(storage)
+            await storage.configure_retention(
+                timedelta(days=settings.status_retention_days) if settings.status_retention_days else None
+            )
+            await preload_latest_pack(state)
+            break
+        except Exception as error:
+            state.warmup["detail"] = f"warm-up failed: {type(error).__name__}: {error}"
+            logger.warning("Warm-up failed, retrying in %.1fs", delay, exc_info=True)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 10.0)
+
+    if settings.status_retention_days or settings.status_minute_rollup_retention_days:
+        state.retention_task = asyncio.create_task(run_status_retention(storage, settings))
+    state.warmup["ready"] = True
+    state.warmup["detail"] = "ready"
+
+
+async def preload_latest_pack(state: State) -> None:
+    try:
+        await refresh_latest_pack_cache(state)
+        logger.info("Preloaded latest broker pack %s", state.latest_pack_cache.version)
+    except HTTPException:
+        logger.info("No broker pack to preload")
+
+
+def init_app_state(state: State, settings: Settings, storage: Storage) -> None:
+    """Storage, caches and background state for one run of an app; each start gets fresh ones."""
+    state.storage = storage
+    state.latest_pack_cache = LatestPackCache(settings.latest_pack_revalidate_seconds)
+    # Storage reads shared by concurrent requests: pack documents by (version, projection),
+    # the latest pointer refresh, and search index builds by version.
+    state.pack_lookups = SingleFlight("pack")
+    state.latest_pack_refreshes = SingleFlight("latest_pack")
+    state.search_index_builds = SingleFlight("search_index")
+    # Pack versions are write-once, so a version's ETag never changes once known, an index never
+    # goes stale (the most recently used ones are kept), and neither does a diff between two of
+    # them that was not precomputed on publish.
+    state.pack_etags = {}
+    state.search_indexes = OrderedDict()
+    state.diff_cache = OrderedDict()
+    state.link_checker = LinkChecker(
+        settings.link_check_concurrency, settings.link_check_per_host,
+        settings.link_check_timeout_seconds, settings.link_check_ttl_seconds
+    )
+    state.link_checks = {}
+    state.status_write_buffer = (
+        StatusWriteBuffer(
+            storage.status_checks.insert_many, settings.status_flush_max_items, settings.status_flush_interval_seconds
+        )
+        if settings.status_write_behind else None
+    )
+    # Readiness: set once storage answered a ping, schema migrations ran and the latest pack is cached.
+    state.warmup = {"ready": False, "detail": "warming up", "task": None}
+    # Background retention pass, started by warm_up once schema migrations have run.
+    state.retention_task = None
+
+
+async def shutdown_app_state(state: State) -> None:
+    if state.warmup["task"]:
+        state.warmup["task"].cancel()
+    if state.retention_task:
+        state.retention_task.cancel()
+    for run in list(state.link_checks.values()):
+        run.cancel()
+    if state.status_write_buffer:
+        await state.status_write_buffer.stop()
+    await state.storage.close()
+
+
+def create_app(settings: Settings) -> FastAPI:
+    """Build the app. Its storage is created, and Mongo connected, only when the app starts."""
+
+    @asynccontextmanager
+    async def lifespan(application: FastAPI):
+        logging.basicConfig(
+            level=settings.log_level,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+        state = application.state
+        init_app_state(state, settings, instrument_storage(create_storage(settings)))
+        # Storage work (migrations included) runs in warm_up, which retries until storage is
+        # reachable; until it is done every /api route but the probes answers 503.
+        state.warmup["task"] = asyncio.create_task(warm_up(state))
+        if state.status_write_buffer:
+            state.status_write_buffer.start()
+        try:
+            yield
+        finally:
+            await shutdown_app_state(state)
+
+    application = FastAPI(lifespan=lifespan)
+    application.include_router(probe_router)
+    application.include_router(api_router)
+    application.state.settings = settings
+
+    # Profiles of the most recent profiled requests, filled by ProfilingMiddleware.
+    application.state.profile_store = ProfileStore(settings.profile_history)
+
+    # Inside the rate limiter, so throttled requests are never profiled.
+    application.add_middleware(
+        ProfilingMiddleware,
+        store=application.state.profile_store,
+        authorize=partial(verify_admin_token, settings),
+        sample_rate=settings.profile_sample_rate,
+        interval_seconds=settings.profile_interval_ms / 1000,
+    )
+
+    # Just outside profiling, so throttled requests are shed before routing and any storage work,
+    # while CORS and metrics still wrap the 429 responses. Only requests with the admin token draw
+    # from the global admin bucket, so anonymous callers cannot lock admins out.
+    if settings.rate_limit_enabled:
+        application.state.rate_limiters = {
+            "public": RateLimiter(
+                settings.rate_limit_public_client_rate, settings.rate_limit_public_client_burst,
+                settings.rate_limit_public_global_rate, settings.rate_limit_public_global_burst
+            ),
+            "admin": RateLimiter(
+                settings.rate_limit_admin_client_rate, settings.rate_limit_admin_client_burst,
+                settings.rate_limit_admin_global_rate, settings.rate_limit_admin_global_burst,
+                global_authenticated_only=True
+            ),
+        }
+        application.add_middleware(
+            RateLimitMiddleware,
+            limiters=application.state.rate_limiters,
+            classify=rate_limit_budget,
+            trusted_proxies=settings.rate_limit_trusted_proxies,
+            authenticate=partial(is_admin, settings),
+        )
+
+    application.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # Browsers only let cross-origin scripts read listed response headers; paging needs this one.
+        expose_headers=["X-Next-Cursor"],
+    )
+
+    # Outermost, so timings include CORS handling. /metrics is not under /api, so nginx does not expose it.
+    application.add_middleware(MetricsMiddleware)
+    application.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+    return application
+
+
+# For `uvicorn server:app`; building it is cheap, and nothing connects until startup.
+app = create_app(Settings.from_env())
@@ -0,0 +1,1330 @@
+"""Persistence for broker packs and status checks.
+
+server.py talks to a Storage, which bundles a BrokerPackRepository and a
+StatusCheckRepository. Three backends are provided:
+
+- MongoStorage: motor/MongoDB, the production default.
+- SQLiteStorage: a single local file via the stdlib sqlite3 module, for small
+  single-node deployments that do not want a Mongo service.
+- MemoryStorage: plain Python structures, for tests and benchmarks.
+
+Pack documents are plain dicts with version, created_at, updated_at, brokers,
+notes, etag and (optionally) encodings, the precompressed bodies keyed by
+content encoding. Broker entries are stored once each, keyed by a hash of their
+content, and packs keep the ordered list of hashes (broker_hashes); the
+repositories reassemble brokers on read, so callers only ever see full packs.
+
+Status checks are dicts with id, client_name and a naive UTC datetime
+timestamp, ordered by (timestamp, id). Inserting status checks also increments
+per-client counts in minute, hour and day buckets (rollups), so aggregate
+queries never scan the raw checks, and raw checks can expire without losing
+their summary.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+# (timestamp, id) of the last status check a client has seen.
+StatusCursor = Tuple[datetime, str]
+
+# (bucket, client_name, bucket start) of one rollup counter.
+RollupKey = Tuple[str, str, datetime]
+
+ROLLUP_BUCKETS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+STATUS_STREAM_BATCH_SIZE = 500
+
+# Broker entries kept decoded in memory per repository; shared entries stay hot across versions.
+DEFAULT_ENTRY_CACHE_SIZE = 20000
+
+
+def diff_id(from_version: str, to_version: str) -> str:
+    return f"{from_version}..{to_version}"
+
+
+def broker_entry_hash(entry: dict) -> str:
+    canonical = json.dumps(entry, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def split_brokers(pack: dict) -> Tuple[dict, Dict[str, dict]]:
+    """Return the pack as stored, with brokers replaced by broker_hashes, and its entries by hash."""
+    hashes = [broker_entry_hash(broker) for broker in pack["brokers"]]
+    stored = {key: value for key, value in pack.items() if key != "brokers"}
+    stored["broker_hashes"] = hashes
+    return stored, dict(zip(hashes, pack["brokers"]))
+
+
+def project_entry(entry: dict, fields: Optional[List[str]]) -> dict:
+    if fields is None:
+        return entry
+    return {field: entry[field] for field in fields if field in entry}
+
+
+def bucket_start(timestamp: datetime, bucket: str) -> datetime:
+    width = ROLLUP_BUCKETS[bucket]
+    return datetime.min + (timestamp - datetime.min) // width * width
+
+
+def rollup_counts(status_checks: Iterable[dict]) -> Dict[RollupKey, int]:
+    counts: Dict[RollupKey, int] = Counter()
+    for status_check in status_checks:
+        for bucket in ROLLUP_BUCKETS:
+            counts[(bucket, status_check["client_name"], bucket_start(status_check["timestamp"], bucket))] += 1
+    return counts
+
+
+class BrokerEntryCache:
+    """LRU of broker entries by content hash. Entries never change, so nothing is ever stale."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, dict]:
+        found = {}
+        for entry_hash in hashes:
+            entry = self.entries.get(entry_hash)
+            if entry is not None:
+                self.entries.move_to_end(entry_hash)
+                found[entry_hash] = entry
+        return found
+
+    def put_many(self, entries: Dict[str, dict]) -> None:
+        for entry_hash, entry in entries.items():
+            self.entries[entry_hash] = entry
+            self.entries.move_to_end(entry_hash)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class BrokerPackRepository:
+    entry_cache: Optional[BrokerEntryCache] = None
+
+    async def get(self, version: str, include_encodings: bool = True, include_brokers: bool = True) -> Optional[dict]:
+        """Return the pack; include_brokers=False skips reassembly when only etag/encodings are needed."""
+        raise NotImplementedError
+
+    async def get_etag(self, version: str) -> Tuple[bool, Optional[str]]:
+        """Return whether the version exists and its stored ETag, without loading the pack."""
+        raise NotImplementedError
+
+    async def get_many(self, versions: List[str]) -> List[dict]:
+        """Return the packs that exist among versions, without encodings."""
+        raise NotImplementedError
+
+    async def recent(self, limit: int) -> List[dict]:
+        """Return the newest packs by created_at, without encodings."""
+        raise NotImplementedError
+
+    async def get_brokers(self, version: str) -> Optional[List[dict]]:
+        raise NotImplementedError
+
+    async def broker_hash_page(self, version: str, offset: int, limit: int) -> Optional[Tuple[int, List[str]]]:
+        """Return the pack's broker count and the hashes of brokers [offset, offset + limit), or None."""
+        raise NotImplementedError
+
+    async def exists(self, version: str) -> bool:
+        raise NotImplementedError
+
+    async def existing_versions(self, versions: List[str]) -> Set[str]:
+        """Return which of versions are already stored, in a single query."""
+        raise NotImplementedError
+
+    async def insert(self, pack: dict) -> None:
+        raise NotImplementedError
+
+    async def insert_many(self, packs: List[dict]) -> None:
+        raise NotImplementedError
+
+    async def get_latest_version(self) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set_latest_version(self, version: str, updated_at: str) -> None:
+        raise NotImplementedError
+
+    async def get_diff(self, from_version: str, to_version: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def save_diff(self, diff: dict) -> None:
+        raise NotImplementedError
+
+    async def load_entries(self, hashes: List[str], fields: Optional[List[str]] = None) -> Dict[str, dict]:
+        """Fetch stored broker entries by content hash, bypassing the cache.
+
+        fields, if given, lets a backend load only those fields of each entry.
+        """
+        raise NotImplementedError
+
+    async def deduplicate_legacy_packs(self) -> int:
+        """Move brokers stored inline on older packs into the entry store; return packs rewritten."""
+        raise NotImplementedError
+
+    async def assemble(self, packs: List[dict]) -> List[dict]:
+        """Return copies of stored packs with broker_hashes resolved, loading uncached entries at once."""
+        needed = {entry_hash for pack in packs for entry_hash in pack.get("broker_hashes", ())}
+        entries = self.entry_cache.get_many(needed) if self.entry_cache else {}
+        missing = [entry_hash for entry_hash in needed if entry_hash not in entries]
+        if missing:
+            loaded = await self.load_entries(missing)
+            if self.entry_cache:
+                self.entry_cache.put_many(loaded)
+            entries.update(loaded)
+
+        assembled = []
+        for pack in packs:
+            # Packs written before deduplication still carry their brokers inline.
+            if "broker_hashes" not in pack:
+                assembled.append(pack)
+                continue
+            copy = {key: value for key, value in pack.items() if key != "broker_hashes"}
+            copy["brokers"] = [entries[entry_hash] for entry_hash in pack["broker_hashes"]]
+            assembled.append(copy)
+        return assembled
+
+    async def get_broker_page(
+        self, version: str, offset: int, limit: int, fields: Optional[List[str]] = None
+    ) -> Optional[Tuple[int, List[dict]]]:
+        """Return the pack's broker count and brokers [offset, offset + limit), or None if it is missing.
+
+        With fields, each broker is cut down to those fields and uncached entries are loaded
+        projected; projected entries are not cached, so the cache only ever holds whole entries.
+        """
+        page = await self.broker_hash_page(version, offset, limit)
+        if page is None:
+            return None
+        total, hashes = page
+        entries = self.entry_cache.get_many(hashes) if self.entry_cache else {}
+        missing = list({entry_hash for entry_hash in hashes if entry_hash not in entries})
+        if missing:
+            loaded = await self.load_entries(missing, fields)
+            if fields is None and self.entry_cache:
+                self.entry_cache.put_many(loaded)
+            entries.update(loaded)
+        return total, [project_entry(entries[entry_hash], fields) for entry_hash in hashes]
+
+
+class StatusCheckRepository:
+    async def insert_one(self, status_check: dict) -> None:
+        raise NotImplementedError
+
+    async def insert_many(self, status_checks: List[dict]) -> None:
+        raise NotImplementedError
+
+    async def page(self, after: Optional[StatusCursor], limit: int) -> List[dict]:
+        raise NotImplementedError
+
+    def stream(self, after: Optional[StatusCursor], limit: Optional[int]) -> AsyncIterator[dict]:
+        """Yield status checks in order without holding more than one batch in memory."""
+        raise NotImplementedError
+
+    async def rollups(
+        self, bucket: str, client_name: Optional[str], start: datetime, end: datetime
+    ) -> List[dict]:
+        """Return client_name, start and count of buckets starting in [start, end), by start then client."""
+        raise NotImplementedError
+
+    async def increment_rollups(self, counts: Dict[RollupKey, int]) -> None:
+        raise NotImplementedError
+
+    async def clear_rollups(self) -> None:
+        raise NotImplementedError
+
+    async def expire(self, before: datetime) -> int:
+        """Delete raw status checks older than before; return how many were deleted."""
+        raise NotImplementedError
+
+    async def expire_rollups(self, bucket: str, before: datetime) -> int:
+        """Delete rollups of one bucket size that start before before; return how many were deleted."""
+        raise NotImplementedError
+
+    async def stats(self, expire_before: Optional[datetime]) -> dict:
+        """Return documents, size_bytes, index_size_bytes, oldest, pending_expiry and rollups.
+
+        Sizes are None where the backend cannot report them; pending_expiry counts raw
+        checks older than expire_before that are still stored.
+        """
+        raise NotImplementedError
+
+    async def rebuild_rollups(self) -> int:
+        """Recompute every rollup from the raw status checks; return how many checks were counted."""
+        await self.clear_rollups()
+        counted = 0
+        batch = []
+        async for status_check in self.stream(None, None):
+            batch.append(status_check)
+            if len(batch) == STATUS_STREAM_BATCH_SIZE:
+                await self.increment_rollups(rollup_counts(batch))
+                counted += len(batch)
+                batch = []
+        if batch:
+            await self.increment_rollups(rollup_counts(batch))
+            counted += len(batch)
+        return counted
+
+
+class Storage:
+    packs: BrokerPackRepository
+    status_checks: StatusCheckRepository
+
+    async def ensure_indexes(self) -> List[str]:
+        """Create any missing indexes and return the names of those created."""
+        return []
+
+    async def configure_retention(self, retention: Optional[timedelta]) -> None:
+        """Set up backend-native expiry of raw status checks, where the backend has one."""
+
+    async def ping(self) -> None:
+        """Raise if the backing database cannot be reached."""
+
+    async def get_schema_version(self) -> int:
+        raise NotImplementedError
+
+    async def set_schema_version(self, version: int, applied_at: str) -> None:
+        raise NotImplementedError
+
+    async def claim_migration(self, owner: str, lease: timedelta) -> bool:
+        """Take or renew the schema migration lease for owner; False while another owner holds it.
+
+        The lease lives in the database, so it excludes other servers and workers sharing it,
+        and it lapses on its own if its holder stops renewing it.
+        """
+        raise NotImplementedError
+
+    async def release_migration(self, owner: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# MongoDB
+# ---------------------------------------------------------------------------
+
+# (collection, keys, name) for every index the queries below rely on.
+# broker_pack_meta, broker_pack_diffs and broker_entries are only read by _id and need none.
+MONGO_INDEXES = [
+    ("broker_packs", [("created_at", -1)], "created_at_desc"),
+    ("status_checks", [("timestamp", 1), ("id", 1)], "timestamp_id"),
+    ("status_checks", [("client_name", 1), ("timestamp", 1)], "client_name_timestamp"),
+    ("status_rollups", [("bucket", 1), ("client_name", 1), ("start", 1)], "bucket_client_name_start"),
+    ("status_rollups", [("bucket", 1), ("start", 1)], "bucket_start"),
+]
+
+MONGO_STATUS_SORT = [("timestamp", 1), ("id", 1)]
+
+# TTL index on status_checks.timestamp, managed by MongoStorage.configure_retention rather
+# than MONGO_INDEXES because its expiry follows STATUS_RETENTION_DAYS.
+MONGO_STATUS_TTL_INDEX = "timestamp_ttl"
+
+
+class MongoBrokerPackRepository(BrokerPackRepository):
+    def __init__(self, db, entry_cache_size: int):
+        self.db = db
+        self.entry_cache = BrokerEntryCache(entry_cache_size)
+
+    def collection(self):
+        return self.db.broker_packs
+
+    def entries_collection(self):
+        return self.db.broker_entries
+
+    def meta_collection(self):
+        return self.db.broker_pack_meta
+
+    def diffs_collection(self):
+        return self.db.broker_pack_diffs
+
+    async def get(self, version, include_encodings=True, include_brokers=True):
+        excluded = {}
+        if not include_encodings:
+            excluded["encodings"] = 0
+        if not include_brokers:
+            excluded.update({"broker_hashes": 0, "brokers": 0})
+        pack = await self.collection().find_one({"_id": version}, excluded or None)
+        if pack is None or not include_brokers:
+            return pack
+        return (await self.assemble([pack]))[0]
+
+    async def get_etag(self, version):
+        stored = await self.collection().find_one({"_id": version}, {"etag": 1})
+        if not stored:
+            return False, None
+        return True, stored.get("etag")
+
+    async def get_many(self, versions):
+        packs = (
+            await self.collection()
+            .find({"_id": {"$in": versions}}, {"encodings": 0})
+            .to_list(len(versions))
+        )
+        return await self.assemble(packs)
+
+    async def recent(self, limit):
+        packs = (
+            await self.collection()
+            .find({}, {"encodings": 0})
+            .sort("created_at", -1)
+            .limit(limit)
+            .to_list(limit)
+        )
+        return await self.assemble(packs)
+
+    async def get_brokers(self, version):
+        pack = await self.collection().find_one({"_id": version}, {"broker_hashes": 1, "brokers": 1})
+        if not pack:
+            return None
+        return (await self.assemble([pack]))[0]["brokers"]
+
+    async def broker_hash_page(self, version, offset, limit):
+        # Count and slice server-side so only the page's hashes cross the wire.
+        pages = await self.collection().aggregate([
+            {"$match": {"_id": version}},
+            {"$project": {
+                "_id": 0,
+                "total": {"$size": "$broker_hashes"},
+                "hashes": {"$slice": ["$broker_hashes", offset, limit]},
+            }},
+        ]).to_list(1)
+        if not pages:
+            return None
+        return pages[0]["total"], pages[0]["hashes"]
+
+    async def exists(self, version):
+        return await self.collection().find_one({"_id": version}, {"_id": 1}) is not None
+
+    async def existing_versions(self, versions):
+        stored = await self.collection().find({"_id": {"$in": versions}}, {"_id": 1}).to_list(len(versions))
+        return {pack["_id"] for pack in stored}
+
+    async def insert(self, pack):
+        await self.insert_many([pack])
+
+    async def insert_many(self, packs):
+        if not packs:
+            return
+        documents = []
+        entries = {}
+        for pack in packs:
+            stored, pack_entries = split_brokers(pack)
+            documents.append({**stored, "_id": pack["version"]})
+            entries.update(pack_entries)
+        # Entries go first so a pack is never visible before the entries it references.
+        await self.save_entries(entries)
+        self.entry_cache.put_many(entries)
+        await self.collection().insert_many(documents)
+
+    async def save_entries(self, entries):
+        from pymongo import UpdateOne
+
+        if entries:
+            await self.entries_collection().bulk_write(
+                [
+                    UpdateOne({"_id": entry_hash}, {"$setOnInsert": {"entry": entry}}, upsert=True)
+                    for entry_hash, entry in entries.items()
+                ],
+                ordered=False
+            )
+
+    async def load_entries(self, hashes, fields=None):
+        projection = {f"entry.{field}": 1 for field in fields} if fields is not None else None
+        stored = await self.entries_collection().find({"_id": {"$in": hashes}}, projection).to_list(len(hashes))
+        return {entry["_id"]: entry.get("entry", {}) for entry in stored}
+
+    async def deduplicate_legacy_packs(self):
+        migrated = 0
+        async for pack in self.collection().find({"brokers": {"$exists": True}}, {"brokers": 1}):
+            stored, entries = split_brokers(pack)
+            await self.save_entries(entries)
+            await self.collection().update_one(
+                {"_id": pack["_id"]},
+                {"$set": {"broker_hashes": stored["broker_hashes"]}, "$unset": {"brokers": ""}}
+            )
+            migrated += 1
+        return migrated
+
+    async def get_latest_version(self):
+        meta = await self.meta_collection().find_one({"_id": "latest"})
+        if meta and meta.get("version"):
+            return meta["version"]
+
+        latest = await self.recent(1)
+        if not latest:
+            return None
+        return latest[0].get("version")
+
+    async def set_latest_version(self, version, updated_at):
+        await self.meta_collection().update_one(
+            {"_id": "latest"},
+            {"$set": {"version": version, "updated_at": updated_at}},
+            upsert=True
+        )
+
+    async def get_diff(self, from_version, to_version):
+        return await self.diffs_collection().find_one({"_id": diff_id(from_version, to_version)})
+
+    async def save_diff(self, diff):
+        await self.diffs_collection().replace_one(
+            {"_id": diff_id(diff["from_version"], diff["to_version"])},
+            diff,
+            upsert=True
+        )
+
+
+class MongoStatusCheckRepository(StatusCheckRepository):
+    def __init__(self, db):
+        self.db = db
+
+    def collection(self):
+        return self.db.status_checks
+
+    def rollups_collection(self):
+        return self.db.status_rollups
+
+    @staticmethod
+    def after_query(after):
+        if not after:
+            return {}
+        timestamp, status_id = after
+        return {"$or": [
+            {"timestamp": {"$gt": timestamp}},
+            {"timestamp": timestamp, "id": {"$gt": status_id}}
+        ]}
+
+    async def insert_one(self, status_check):
+        await self.collection().insert_one({**status_check})
+        await self.increment_rollups(rollup_counts([status_check]))
+
+    async def insert_many(self, status_checks):
+        if status_checks:
+            await self.collection().insert_many([{**item} for item in status_checks], ordered=False)
+            await self.increment_rollups(rollup_counts(status_checks))
+
+    async def page(self, after, limit):
+        return (
+            await self.collection()
+            .find(self.after_query(after))
+            .sort(MONGO_STATUS_SORT)
+            .limit(limit)
+            .to_list(limit)
+        )
+
+    async def stream(self, after, limit):
+        documents = (
+            self.collection()
+            .find(self.after_query(after))
+            .sort(MONGO_STATUS_SORT)
+            .batch_size(STATUS_STREAM_BATCH_SIZE)
+        )
+        if limit:
+            documents = documents.limit(limit)
+        async for status_check in documents:
+            yield status_check
+
+    async def rollups(self, bucket, client_name, start, end):
+        query = {"bucket": bucket, "start": {"$gte": start, "$lt": end}}
+        if client_name is not None:
+            query["client_name"] = client_name
+        return (
+            await self.rollups_collection()
+            .find(query, {"_id": 0, "client_name": 1, "start": 1, "count": 1})
+            .sort([("start", 1), ("client_name", 1)])
+            .to_list(None)
+        )
+
+    async def increment_rollups(self, counts):
+        from pymongo import UpdateOne
+
+        if not counts:
+            return
+        # A deterministic _id makes concurrent upserts of the same bucket converge on one document.
+        await self.rollups_collection().bulk_write(
+            [
+                UpdateOne(
+                    {"_id": f"{bucket}|{client_name}|{start.isoformat()}"},
+                    {
+                        "$inc": {"count": count},
+                        "$setOnInsert": {"bucket": bucket, "client_name": client_name, "start": start},
+                    },
+                    upsert=True
+                )
+                for (bucket, client_name, start), count in counts.items()
+            ],
+            ordered=False
+        )
+
+    async def clear_rollups(self):
+        await self.rollups_collection().delete_many({})
+
+    async def expire(self, before):
+        # The timestamp_ttl index has the server's TTL monitor delete expired checks.
+        return 0
+
+    async def expire_rollups(self, bucket, before):
+        result = await self.rollups_collection().delete_many({"bucket": bucket, "start": {"$lt": before}})
+        return result.deleted_count
+
+    async def stats(self, expire_before):
+        collection_stats = await self.collection().aggregate([{"$collStats": {"storageStats": {}}}]).to_list(1)
+        storage_stats = collection_stats[0]["storageStats"] if collection_stats else {}
+        oldest = await self.collection().find_one({}, {"timestamp": 1}, sort=MONGO_STATUS_SORT)
+        pending_expiry = 0
+        if expire_before:
+            pending_expiry = await self.collection().count_documents({"timestamp": {"$lt": expire_before}})
+        return {
+            "documents": storage_stats.get("count", 0),
+            "size_bytes": storage_stats.get("size"),
+            "index_size_bytes": storage_stats.get("totalIndexSize"),
+            "oldest": oldest["timestamp"] if oldest else None,
+            "pending_expiry": pending_expiry,
+            "rollups": await self.rollups_collection().estimated_document_count(),
+        }
+
+
+class MongoStorage(Storage):
+    def __init__(self, client, db_name: str, entry_cache_size: int = DEFAULT_ENTRY_CACHE_SIZE):
+        self.client = client
+        self.db = client[db_name]
+        self.packs = MongoBrokerPackRepository(self.db, entry_cache_size)
+        self.status_checks = MongoStatusCheckRepository(self.db)
+
+    async def ensure_indexes(self):
+        created = []
+        for collection_name, keys, name in MONGO_INDEXES:
+            collection = self.db[collection_name]
+            existing = await collection.index_information()
+            if name in existing:
+                continue
+            await collection.create_index(keys, name=name)
+            created.append(f"{collection_name}.{name}")
+        return created
+
+    async def configure_retention(self, retention):
+        collection = self.db.status_checks
+        existing = (await collection.index_information()).get(MONGO_STATUS_TTL_INDEX)
+        if retention is None:
+            if existing:
+                await collection.drop_index(MONGO_STATUS_TTL_INDEX)
+            return
+
+        seconds = int(retention.total_seconds())
+        if existing is None:
+            await collection.create_index([("timestamp", 1)], name=MONGO_STATUS_TTL_INDEX, expireAfterSeconds=seconds)
+        elif existing.get("expireAfterSeconds") != seconds:
+            await self.db.command(
+                "collMod", "status_checks", index={"name": MONGO_STATUS_TTL_INDEX, "expireAfterSeconds": seconds}
+            )
+
+    async def ping(self):
+        await self.client.admin.command("ping")
+
+    async def get_schema_version(self):
+        meta = await self.db.schema_meta.find_one({"_id": "schema"})
+        return meta.get("version", 0) if meta else 0
+
+    async def set_schema_version(self, version, applied_at):
+        await self.db.schema_meta.update_one(
+            {"_id": "schema"},
+            {"$set": {"version": version, "applied_at": applied_at}},
+            upsert=True
+        )
+
+    async def claim_migration(self, owner, lease):
+        from pymongo.errors import DuplicateKeyError
+
+        now = datetime.utcnow()
+        # While another owner holds an unexpired lease the filter matches nothing, and the
+        # upsert then collides with the existing _id instead of inserting a second lease.
+        try:
+            await self.db.schema_meta.update_one(
+                {"_id": "migration", "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + lease}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release_migration(self, owner):
+        await self.db.schema_meta.delete_one({"_id": "migration", "owner": owner})
+
+    async def close(self):
+        self.client.close()
+
+
+# ---------------------------------------------------------------------------
+# In-memory
+# ---------------------------------------------------------------------------
+
+def without_encodings(pack: dict) -> dict:
+    return {key: value for key, value in pack.items() if key != "encodings"}
+
+
+class MemoryBrokerPackRepository(BrokerPackRepository):
+    def __init__(self):
+        self.packs: Dict[str, dict] = {}
+        self.entries: Dict[str, dict] = {}
+        self.diffs: Dict[str, dict] = {}
+        self.latest_version: Optional[str] = None
+
+    async def get(self, version, include_encodings=True, include_brokers=True):
+        pack = self.packs.get(version)
+        if pack is None:
+            return None
+        if not include_encodings:
+            pack = without_encodings(pack)
+        if not include_brokers:
+            return {key: value for key, value in pack.items() if key != "broker_hashes"}
+        return (await self.assemble([pack]))[0]
+
+    async def get_etag(self, version):
+        pack = self.packs.get(version)
+        if pack is None:
+            return False, None
+        return True, pack.get("etag")
+
+    async def get_many(self, versions):
+        return await self.assemble(
+            [without_encodings(self.packs[version]) for version in versions if version in self.packs]
+        )
+
+    async def recent(self, limit):
+        newest = sorted(self.packs.values(), key=lambda pack: pack["created_at"], reverse=True)
+        return await self.assemble([without_encodings(pack) for pack in newest[:limit]])
+
+    async def get_brokers(self, version):
+        pack = await self.get(version, include_encodings=False)
+        return pack["brokers"] if pack else None
+
+    async def broker_hash_page(self, version, offset, limit):
+        pack = self.packs.get(version)
+        if pack is None:
+            return None
+        return len(pack["broker_hashes"]), pack["broker_hashes"][offset:offset + limit]
+
+    async def exists(self, version):
+        return version in self.packs
+
+    async def existing_versions(self, versions):
+        return {version for version in versions if version in self.packs}
+
+    async def insert(self, pack):
+        stored, entries = split_brokers(pack)
+        for entry_hash, entry in entries.items():
+            self.entries.setdefault(entry_hash, entry)
+        self.packs[pack["version"]] = stored
+
+    async def insert_many(self, packs):
+        for pack in packs:
+            await self.insert(pack)
+
+    async def load_entries(self, hashes, fields=None):
+        return {entry_hash: self.entries[entry_hash] for entry_hash in hashes}
+
+    async def deduplicate_legacy_packs(self):
+        return 0
+
+    async def get_latest_version(self):
+        if self.latest_version:
+            return self.latest_version
+        latest = await self.recent(1)
+        return latest[0]["version"] if latest else None
+
+    async def set_latest_version(self, version, updated_at):
+        self.latest_version = version
+
+    async def get_diff(self, from_version, to_version):
+        return self.diffs.get(diff_id(from_version, to_version))
+
+    async def save_diff(self, diff):
+        self.diffs[diff_id(diff["from_version"], diff["to_version"])] = diff
+
+
+class MemoryStatusCheckRepository(StatusCheckRepository):
+    def __init__(self):
+        # Kept sorted by (timestamp, id) so pages are a bisect and a slice.
+        self.keys: List[StatusCursor] = []
+        self.documents: List[dict] = []
+        self.rollup_counts: Dict[RollupKey, int] = Counter()
+
+    async def insert_one(self, status_check):
+        key = (status_check["timestamp"], status_check["id"])
+        position = bisect.bisect_right(self.keys, key)
+        self.keys.insert(position, key)
+        self.documents.insert(position, {**status_check})
+        await self.increment_rollups(rollup_counts([status_check]))
+
+    async def insert_many(self, status_checks):
+        for status_check in status_checks:
+            await self.insert_one(status_check)
+
+    def start(self, after):
+        return bisect.bisect_right(self.keys, after) if after else 0
+
+    async def page(self, after, limit):
+        start = self.start(after)
+        return self.documents[start:start + limit]
+
+    async def stream(self, after, limit):
+        start = self.start(after)
+        end = start + limit if limit else len(self.documents)
+        for status_check in self.documents[start:end]:
+            yield status_check
+
+    async def rollups(self, bucket, client_name, start, end):
+        matching = [
+            (key_start, key_client_name, count)
+            for (key_bucket, key_client_name, key_start), count in self.rollup_counts.items()
+            if key_bucket == bucket and start <= key_start < end
+            and (client_name is None or key_client_name == client_name)
+        ]
+        return [
+            {"client_name": key_client_name, "start": key_start, "count": count}
+            for key_start, key_client_name, count in sorted(matching)
+        ]
+
+    async def increment_rollups(self, counts):
+        self.rollup_counts.update(counts)
+
+    async def clear_rollups(self):
+        self.rollup_counts.clear()
+
+    async def expire(self, before):
+        end = bisect.bisect_left(self.keys, (before, ""))
+        del self.keys[:end]
+        del self.documents[:end]
+        return end
+
+    async def expire_rollups(self, bucket, before):
+        expired = [key for key in self.rollup_counts if key[0] == bucket and key[2] < before]
+        for key in expired:
+            del self.rollup_counts[key]
+        return len(expired)
+
+    async def stats(self, expire_before):
+        return {
+            "documents": len(self.documents),
+            "size_bytes": None,
+            "index_size_bytes": None,
+            "oldest": self.keys[0][0] if self.keys else None,
+            "pending_expiry": bisect.bisect_left(self.keys, (expire_before, "")) if expire_before else 0,
+            "rollups": len(self.rollup_counts),
+        }
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.packs = MemoryBrokerPackRepository()
+        self.status_checks = MemoryStatusCheckRepository()
+        self.schema_version = 0
+        # (owner, expires_at) of the schema migration lease.
+        self.migration_lease: Optional[Tuple[str, datetime]] = None
+
+    async def get_schema_version(self):
+        return self.schema_version
+
+    async def set_schema_version(self, version, applied_at):
+        self.schema_version = version
+
+    async def claim_migration(self, owner, lease):
+        now = datetime.utcnow()
+        if self.migration_lease and self.migration_lease[0] != owner and self.migration_lease[1] > now:
+            return False
+        self.migration_lease = (owner, now + lease)
+        return True
+
+    async def release_migration(self, owner):
+        if self.migration_lease and self.migration_lease[0] == owner:
+            self.migration_lease = None
+
+
+# ---------------------------------------------------------------------------
+# SQLite
+# ---------------------------------------------------------------------------
+
+SQLITE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS broker_packs (
+        version TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        etag TEXT,
+        document TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS broker_pack_encodings (
+        version TEXT NOT NULL,
+        encoding TEXT NOT NULL,
+        body BLOB NOT NULL,
+        PRIMARY KEY (version, encoding)
+    )""",
+    """CREATE TABLE IF NOT EXISTS broker_entries (
+        hash TEXT PRIMARY KEY,
+        document TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS broker_pack_diffs (
+        id TEXT PRIMARY KEY,
+        document TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS status_checks (
+        id TEXT PRIMARY KEY,
+        client_name TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS status_rollups (
+        bucket TEXT NOT NULL,
+        client_name TEXT NOT NULL,
+        start TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (bucket, client_name, start)
+    )""",
+]
+
+# name -> DDL, mirroring MONGO_INDEXES.
+SQLITE_INDEXES = {
+    "broker_packs_created_at": (
+        "CREATE INDEX IF NOT EXISTS broker_packs_created_at ON broker_packs (created_at DESC)"
+    ),
+    "status_checks_timestamp_id": (
+        "CREATE INDEX IF NOT EXISTS status_checks_timestamp_id ON status_checks (timestamp, id)"
+    ),
+    "status_checks_client_name_timestamp": (
+        "CREATE INDEX IF NOT EXISTS status_checks_client_name_timestamp ON status_checks (client_name, timestamp)"
+    ),
+    # (bucket, client_name, start) is the primary key; this serves queries across all clients.
+    "status_rollups_bucket_start": (
+        "CREATE INDEX IF NOT EXISTS status_rollups_bucket_start ON status_rollups (bucket, start)"
+    ),
+}
+
+# Fixed-width so that text order is chronological order.
+SQLITE_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class SQLiteDatabase:
+    """Runs sqlite3 calls on worker threads, one at a time, over a shared connection."""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL durable against application crashes; only a power loss can drop the last commits.
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.lock = threading.Lock()
+
+    def _run(self, sql, params, many, fetch):
+        with self.lock:
+            if many:
+                self._transaction([(sql, params)])
+                return []
+            cursor = self.connection.execute(sql, params)
+            return cursor.fetchall() if fetch else cursor.rowcount
+
+    def _run_transaction(self, statements):
+        with self.lock:
+            self._transaction(statements)
+
+    def _transaction(self, statements):
+        # The connection is in autocommit mode, where `with connection` opens no transaction
+        # and every statement commits alone, so BEGIN is explicit. IMMEDIATE takes the write
+        # lock up front rather than failing to upgrade to it against another process.
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                self.connection.executemany(sql, params)
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    async def fetch(self, sql: str, params=()) -> List[sqlite3.Row]:
+        return await asyncio.to_thread(self._run, sql, params, False, True)
+
+    async def fetch_one(self, sql: str, params=()) -> Optional[sqlite3.Row]:
+        rows = await self.fetch(sql, params)
+        return rows[0] if rows else None
+
+    async def execute(self, sql: str, params=()) -> int:
+        """Run one statement and return the number of rows it changed."""
+        return await asyncio.to_thread(self._run, sql, params, False, False)
+
+    async def execute_many(self, sql: str, params) -> None:
+        await asyncio.to_thread(self._run, sql, params, True, False)
+
+    async def execute_transaction(self, statements: List[Tuple[str, list]]) -> None:
+        """Run each (sql, rows) with executemany, all in a single transaction."""
+        await asyncio.to_thread(self._run_transaction, statements)
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+def pack_from_row(row: sqlite3.Row) -> dict:
+    pack = json.loads(row["document"])
+    pack["etag"] = row["etag"]
+    return pack
+
+
+class SQLiteBrokerPackRepository(BrokerPackRepository):
+    def __init__(self, database: SQLiteDatabase, entry_cache_size: int):
+        self.database = database
+        self.entry_cache = BrokerEntryCache(entry_cache_size)
+
+    async def get(self, version, include_encodings=True, include_brokers=True):
+        row = await self.database.fetch_one(
+            "SELECT document, etag FROM broker_packs WHERE version = ?", (version,)
+        )
+        if row is None:
+            return None
+        pack = pack_from_row(row)
+        if include_encodings:
+            encodings = await self.database.fetch(
+                "SELECT encoding, body FROM broker_pack_encodings WHERE version = ?", (version,)
+            )
+            pack["encodings"] = {encoding["encoding"]: bytes(encoding["body"]) for encoding in encodings}
+        if not include_brokers:
+            pack.pop("broker_hashes", None)
+            return pack
+        return (await self.assemble([pack]))[0]
+
+    async def get_etag(self, version):
+        row = await self.database.fetch_one("SELECT etag FROM broker_packs WHERE version = ?", (version,))
+        if row is None:
+            return False, None
+        return True, row["etag"]
+
+    async def get_many(self, versions):
+        if not versions:
+            return []
+        placeholders = ", ".join("?" for _ in versions)
+        rows = await self.database.fetch(
+            f"SELECT document, etag FROM broker_packs WHERE version IN ({placeholders})", tuple(versions)
+        )
+        return await self.assemble([pack_from_row(row) for row in rows])
+
+    async def recent(self, limit):
+        rows = await self.database.fetch(
+            "SELECT document, etag FROM broker_packs ORDER BY created_at DESC LIMIT ?", (limit,)
+        )
+        return await self.assemble([pack_from_row(row) for row in rows])
+
+    async def get_brokers(self, version):
+        pack = await self.get(version, include_encodings=False)
+        return pack["brokers"] if pack else None
+
+    async def broker_hash_page(self, version, offset, limit):
+        row = await self.database.fetch_one(
+            """
+            SELECT
+                json_array_length(document, '$.broker_hashes') AS total,
+                (
+                    SELECT json_group_array(value)
+                    FROM (SELECT value FROM json_each(document, '$.broker_hashes') ORDER BY key LIMIT ? OFFSET ?)
+                ) AS hashes
+            FROM broker_packs WHERE version = ?
+            """,
+            (limit, offset, version)
+        )
+        if row is None:
+            return None
+        return row["total"], json.loads(row["hashes"])
+
+    async def exists(self, version):
+        row = await self.database.fetch_one("SELECT 1 FROM broker_packs WHERE version = ?", (version,))
+        return row is not None
+
+    async def existing_versions(self, versions):
+        if not versions:
+            return set()
+        placeholders = ", ".join("?" for _ in versions)
+        rows = await self.database.fetch(
+            f"SELECT version FROM broker_packs WHERE version IN ({placeholders})", tuple(versions)
+        )
+        return {row["version"] for row in rows}
+
+    async def insert(self, pack):
+        await self.insert_many([pack])
+
+    async def insert_many(self, packs):
+        if not packs:
+            return
+        rows = []
+        encodings = []
+        entries = {}
+        for pack in packs:
+            stored, pack_entries = split_brokers(pack)
+            entries.update(pack_entries)
+            document = {key: value for key, value in stored.items() if key not in ("etag", "encodings")}
+            rows.append((pack["version"], pack["created_at"], pack.get("etag"), json.dumps(document)))
+            encodings += [(pack["version"], encoding, body) for encoding, body in (pack.get("encodings") or {}).items()]
+        statements = [
+            self.save_entries_statement(entries),
+            ("INSERT INTO broker_packs (version, created_at, etag, document) VALUES (?, ?, ?, ?)", rows),
+        ]
+        if encodings:
+            statements.append(
+                ("INSERT INTO broker_pack_encodings (version, encoding, body) VALUES (?, ?, ?)", encodings)
+            )
+        # One transaction, so a pack is never visible without its entries or encodings, and a
+        # failed publish leaves none of them behind.
+        await self.database.execute_transaction(statements)
+        self.entry_cache.put_many(entries)
+
+    @staticmethod
+    def save_entries_statement(entries):
+        return (
+            "INSERT OR IGNORE INTO broker_entries (hash, document) VALUES (?, ?)",
+            [(entry_hash, json.dumps(entry)) for entry_hash, entry in entries.items()]
+        )
+
+    async def load_entries(self, hashes, fields=None):
+        entries = {}
+        # Stay under SQLite's bound-parameter limit.
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = await self.database.fetch(
+                f"SELECT hash, document FROM broker_entries WHERE hash IN ({placeholders})", tuple(chunk)
+            )
+            entries.update((row["hash"], json.loads(row["document"])) for row in rows)
+        return entries
+
+    async def deduplicate_legacy_packs(self):
+        rows = await self.database.fetch(
+            "SELECT version, document FROM broker_packs WHERE json_extract(document, '$.brokers') IS NOT NULL"
+        )
+        for row in rows:
+            stored, entries = split_brokers(json.loads(row["document"]))
+            await self.database.execute_transaction([
+                self.save_entries_statement(entries),
+                ("UPDATE broker_packs SET document = ? WHERE version = ?", [(json.dumps(stored), row["version"])]),
+            ])
+        return len(rows)
+
+    async def get_latest_version(self):
+        row = await self.database.fetch_one("SELECT value FROM meta WHERE key = 'latest_version'")
+        if row:
+            return row["value"]
+        row = await self.database.fetch_one("SELECT version FROM broker_packs ORDER BY created_at DESC LIMIT 1")
+        return row["version"] if row else None
+
+    async def set_latest_version(self, version, updated_at):
+        await self.database.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('latest_version', ?)", (version,)
+        )
+
+    async def get_diff(self, from_version, to_version):
+        row = await self.database.fetch_one(
+            "SELECT document FROM broker_pack_diffs WHERE id = ?", (diff_id(from_version, to_version),)
+        )
+        return json.loads(row["document"]) if row else None
+
+    async def save_diff(self, diff):
+        await self.database.execute(
+            "INSERT OR REPLACE INTO broker_pack_diffs (id, document) VALUES (?, ?)",
+            (diff_id(diff["from_version"], diff["to_version"]), json.dumps(diff))
+        )
+
+
+class SQLiteStatusCheckRepository(StatusCheckRepository):
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+
+    @staticmethod
+    def to_row(status_check):
+        return (
+            status_check["id"],
+            status_check["client_name"],
+            status_check["timestamp"].strftime(SQLITE_TIMESTAMP_FORMAT)
+        )
+
+    @staticmethod
+    def from_row(row):
+        return {
+            "id": row["id"],
+            "client_name": row["client_name"],
+            "timestamp": datetime.strptime(row["timestamp"], SQLITE_TIMESTAMP_FORMAT),
+        }
+
+    async def insert_one(self, status_check):
+        await self.insert_many([status_check])
+
+    async def insert_many(self, status_checks):
+        if status_checks:
+            await self.database.execute_transaction([
+                (
+                    "INSERT INTO status_checks (id, client_name, timestamp) VALUES (?, ?, ?)",
+                    [self.to_row(status_check) for status_check in status_checks]
+                ),
+                self.increment_rollups_statement(rollup_counts(status_checks)),
+            ])
+
+    async def page(self, after, limit):
+        if after:
+            rows = await self.database.fetch(
+                "SELECT id, client_name, timestamp FROM status_checks WHERE (timestamp, id) > (?, ?) "
+                "ORDER BY timestamp, id LIMIT ?",
+                (after[0].strftime(SQLITE_TIMESTAMP_FORMAT), after[1], limit)
+            )
+        else:
+            rows = await self.database.fetch(
+                "SELECT id, client_name, timestamp FROM status_checks ORDER BY timestamp, id LIMIT ?", (limit,)
+            )
+        return [self.from_row(row) for row in rows]
+
+    async def stream(self, after, limit):
+        remaining = limit
+        while remaining is None or remaining > 0:
+            batch_size = STATUS_STREAM_BATCH_SIZE if remaining is None else min(remaining, STATUS_STREAM_BATCH_SIZE)
+            batch = await self.page(after, batch_size)
+            for status_check in batch:
+                yield status_check
+            if len(batch) < batch_size:
+                return
+            after = (batch[-1]["timestamp"], batch[-1]["id"])
+            if remaining is not None:
+                remaining -= len(batch)
+
+
+    async def rollups(self, bucket, client_name, start, end):
+        sql = "SELECT client_name, start, count FROM status_rollups WHERE bucket = ? AND start >= ? AND start < ?"
+        params = [bucket, start.strftime(SQLITE_TIMESTAMP_FORMAT), end.strftime(SQLITE_TIMESTAMP_FORMAT)]
+        if client_name is not None:
+            sql += " AND client_name = ?"
+            params.append(client_name)
+        rows = await self.database.fetch(sql + " ORDER BY start, client_name", tuple(params))
+        return [
+            {
+                "client_name": row["client_name"],
+                "start": datetime.strptime(row["start"], SQLITE_TIMESTAMP_FORMAT),
+                "count": row["count"],
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def increment_rollups_statement(counts):
+        return (
+            "INSERT INTO status_rollups (bucket, client_name, start, count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (bucket, client_name, start) DO UPDATE SET count = count + excluded.count",
+            [
+                (bucket, client_name, start.strftime(SQLITE_TIMESTAMP_FORMAT), count)
+                for (bucket, client_name, start), count in counts.items()
+            ]
+        )
+
+    async def increment_rollups(self, counts):
+        if counts:
+            await self.database.execute_transaction([self.increment_rollups_statement(counts)])
+
+    async def clear_rollups(self):
+        await self.database.execute("DELETE FROM status_rollups")
+
+    async def expire(self, before):
+        return await self.database.execute(
+            "DELETE FROM status_checks WHERE timestamp < ?", (before.strftime(SQLITE_TIMESTAMP_FORMAT),)
+        )
+
+    async def expire_rollups(self, bucket, before):
+        return await self.database.execute(
+            "DELETE FROM status_rollups WHERE bucket = ? AND start < ?",
+            (bucket, before.strftime(SQLITE_TIMESTAMP_FORMAT))
+        )
+
+    async def table_size(self, names_sql: str) -> Optional[int]:
+        # dbstat is only available when SQLite was built with SQLITE_ENABLE_DBSTAT_VTAB.
+        try:
+            row = await self.database.fetch_one(f"SELECT SUM(pgsize) AS size FROM dbstat WHERE name IN ({names_sql})")
+        except sqlite3.OperationalError:
+            return None
+        return row["size"] or 0
+
+    async def stats(self, expire_before):
+        documents = await self.database.fetch_one("SELECT COUNT(*) AS count, MIN(timestamp) AS oldest FROM status_checks")
+        pending_expiry = 0
+        if expire_before:
+            row = await self.database.fetch_one(
+                "SELECT COUNT(*) AS count FROM status_checks WHERE timestamp < ?",
+                (expire_before.strftime(SQLITE_TIMESTAMP_FORMAT),)
+            )
+            pending_expiry = row["count"]
+        rollups = await self.database.fetch_one("SELECT COUNT(*) AS count FROM status_rollups")
+        return {
+            "documents": documents["count"],
+            "size_bytes": await self.table_size("'status_checks'"),
+            "index_size_bytes": await self.table_size(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'status_checks'"
+            ),
+            "oldest": datetime.strptime(documents["oldest"], SQLITE_TIMESTAMP_FORMAT) if documents["oldest"] else None,
+            "pending_expiry": pending_expiry,
+            "rollups": rollups["count"],
+        }
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path: str, entry_cache_size: int = DEFAULT_ENTRY_CACHE_SIZE):
+        self.database = SQLiteDatabase(path)
+        for statement in SQLITE_TABLES:
+            self.database.connection.execute(statement)
+        self.packs = SQLiteBrokerPackRepository(self.database, entry_cache_size)
+        self.status_checks = SQLiteStatusCheckRepository(self.database)
+
+    async def ensure_indexes(self):
+        rows = await self.database.fetch("SELECT name FROM sqlite_master WHERE type = 'index'")
+        existing = {row["name"] for row in rows}
+        created = []
+        for name, statement in SQLITE_INDEXES.items():
+            if name in existing:
+                continue
+            await self.database.execute(statement)
+            created.append(name)
+        return created
+
+    async def ping(self):
+        await self.database.fetch_one("SELECT 1")
+
+    async def get_schema_version(self):
+        row = await self.database.fetch_one("SELECT value FROM meta WHERE key = 'schema_version'")
+        return int(row["value"]) if row else 0
+
+    async def set_schema_version(self, version, applied_at):
+        await self.database.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(version),)
+        )
+
+    async def claim_migration(self, owner, lease):
+        now = datetime.utcnow()
+        # One upsert, so the check and the take are atomic across every connection to the file.
+        changed = await self.database.execute(
+            "INSERT INTO meta (key, value) VALUES ('migration', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value "
+            "WHERE json_extract(meta.value, '$.owner') = ? OR json_extract(meta.value, '$.expires_at') <= ?",
+            (
+                json.dumps({"owner": owner, "expires_at": (now + lease).strftime(SQLITE_TIMESTAMP_FORMAT)}),
+                owner,
+                now.strftime(SQLITE_TIMESTAMP_FORMAT)
+            )
+        )
+        return changed > 0
+
+    async def release_migration(self, owner):
+        await self.database.execute(
+            "DELETE FROM meta WHERE key = 'migration' AND json_extract(value, '$.owner') = ?", (owner,)
+        )
+
+    async def close(self):
+        self.database.close()
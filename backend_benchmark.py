@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Backend Load and Latency Benchmark
+Runs server:app in-process and drives concurrent load at the broker pack, import, status and
+link health routes.
+
+--storage picks the persistence backend: "memory" and "sqlite" use the app's own
+in-memory and SQLite storage, "mongomock" runs the Mongo storage against
+mongomock-motor, and "mongo" needs --mongo-url. Only "mongo" needs a database
+service. Results are written as JSON so runs can be compared:
+
+    python backend_benchmark.py --output bench.json
+    python backend_benchmark.py --output bench-new.json --compare bench.json
+
+The time to import server.py is also measured, in fresh interpreters with the same
+environment, since every worker and test run pays it. So is one cold link check run over a
+pack whose opt_out_urls point at a local stand-in server.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+ADMIN_TOKEN = "benchmark-admin-token"
+ADMIN_HEADERS = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+LINKS_VERSION = "bench-links"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--storage", choices=["memory", "sqlite", "mongomock", "mongo"], default="memory")
+    parser.add_argument("--mongo-url", help="MongoDB to benchmark against with --storage mongo")
+    parser.add_argument("--db-name", default="datawipe_benchmark")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent in-flight requests")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per scenario, e.g. to fill caches")
+    parser.add_argument("--brokers", type=int, default=2000, help="Brokers per seeded pack")
+    parser.add_argument("--versions", type=int, default=3, help="Pack versions to seed")
+    parser.add_argument("--status-checks", type=int, default=5000, help="Status checks to seed")
+    parser.add_argument("--scenario", action="append", help="Only run the named scenario(s)")
+    parser.add_argument("--import-runs", type=int, default=5, help="Fresh interpreters to time importing server in")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Previous results file to report deltas against")
+    return parser.parse_args()
+
+
+def load_app(args):
+    """Import server:app with the environment pointed at the benchmark database."""
+    os.environ["ADMIN_TOKEN"] = ADMIN_TOKEN
+    # Every benchmark request comes from one client address; measure the handlers, not the limiter.
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    os.environ["STORAGE_BACKEND"] = "mongo" if args.storage == "mongomock" else args.storage
+
+    if args.storage == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="datawipe-bench-"), "bench.sqlite3")
+    elif args.storage == "mongo":
+        if not args.mongo_url:
+            sys.exit("--storage mongo requires --mongo-url")
+        os.environ["MONGO_URL"] = args.mongo_url
+        os.environ["DB_NAME"] = args.db_name
+    elif args.storage == "mongomock":
+        try:
+            import mongomock_motor
+        except ImportError:
+            sys.exit("--storage mongomock requires mongomock-motor (pip install mongomock-motor)")
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+        os.environ["MONGO_URL"] = "mongodb://benchmark-stand-in"
+        os.environ["DB_NAME"] = args.db_name
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+def measure_import_seconds(runs):
+    """Best-of-runs wall time to import server in a new interpreter, with the current environment."""
+    script = "import time; started = time.perf_counter(); import server; print(time.perf_counter() - started)"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=BACKEND_DIR, env=os.environ.copy())
+        timings.append(float(output.decode().split()[-1]))
+    return min(timings) if timings else None
+
+
+def make_brokers(count, revision):
+    brokers = []
+    for i in range(count):
+        brokers.append({
+            "id": f"broker-{i}",
+            "name": f"Broker {i} People Search",
+            "opt_out_url": f"https://broker-{i}.example.com/opt-out",
+            "form_type": ["web", "email", "mail"][i % 3],
+            "required_fields": ["Full name", "Email"] if i % 2 else ["Full name", "Address"],
+            "verification_steps": "Submit the form and confirm the link sent to your email.",
+            "response_time": "Varies; check confirmation email.",
+            # Every tenth broker changes between revisions so the diff scenario has work to do.
+            "follow_up_guidance": f"Revision {revision if i % 10 == 0 else 0}: resubmit after 30 days."
+        })
+    return brokers
+
+
+class LinkStandIn(ThreadingHTTPServer):
+    """Local opt-out pages for the link check, so it measures the checker rather than the internet."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), LinkStandInHandler)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class LinkStandInHandler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.send_response(404 if self.path.endswith("/broken") else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def make_link_brokers(count, links):
+    """Brokers whose opt_out_urls are on the stand-in; every tenth one is broken."""
+    brokers = []
+    for i in range(count):
+        path = f"/opt-out/{i}/broken" if i % 10 == 0 else f"/opt-out/{i}"
+        brokers.append({"id": f"link-{i}", "name": f"Link {i}", "opt_out_url": links.url(path)})
+    return brokers
+
+
+async def wait_until_ready(client, timeout_seconds=60.0):
+    """Every /api route but the probes answers 503 until the app's warm-up is done."""
+    deadline = time.monotonic() + timeout_seconds
+    while (await client.get("/api/readyz")).status_code != 200:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Backend not ready after {timeout_seconds:.0f}s")
+        await asyncio.sleep(0.05)
+
+
+async def seed(client, args, links):
+    # Published first, so the latest pack is still the last bench-N revision.
+    response = await client.post(
+        "/api/broker-packs",
+        json={"version": LINKS_VERSION, "brokers": make_link_brokers(args.brokers, links)},
+        headers=ADMIN_HEADERS
+    )
+    if response.status_code not in (200, 409):
+        raise RuntimeError(f"Seeding pack {LINKS_VERSION} failed: {response.status_code} {response.text}")
+
+    for revision in range(args.versions):
+        response = await client.post(
+            "/api/broker-packs",
+            json={"version": f"bench-{revision}", "brokers": make_brokers(args.brokers, revision)},
+            headers=ADMIN_HEADERS
+        )
+        if response.status_code not in (200, 409):
+            raise RuntimeError(f"Seeding pack bench-{revision} failed: {response.status_code} {response.text}")
+
+    remaining = args.status_checks
+    while remaining > 0:
+        batch = min(remaining, 1000)
+        response = await client.post(
+            "/api/status/batch",
+            json=[{"client_name": f"client-{i % 20}"} for i in range(batch)]
+        )
+        response.raise_for_status()
+        remaining -= batch
+
+
+async def measure_link_check(client):
+    """Wall time of one cold link check run over every opt_out_url of the links pack."""
+    started = time.perf_counter()
+    response = await client.post(
+        f"/api/admin/broker-packs/{LINKS_VERSION}/link-health?wait=true", headers=ADMIN_HEADERS
+    )
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def import_body(brokers):
+    """Body factory for the import scenario: each call is a new version, so every request writes a pack."""
+    revisions = itertools.count()
+
+    def body():
+        return (json.dumps({"version": f"import-{next(revisions)}", "brokers": brokers}) + "\n").encode()
+    return body
+
+
+def request_body(body):
+    """httpx arguments for a scenario body: bytes from a body factory, anything else as JSON."""
+    return {"content": body()} if callable(body) else {"json": body}
+
+
+def build_scenarios(args):
+    latest = f"bench-{args.versions - 1}"
+    first = "bench-0"
+    return {
+        "latest": ("GET", "/api/broker-packs/latest", {}, None),
+        "latest_gzip": ("GET", "/api/broker-packs/latest", {"Accept-Encoding": "gzip"}, None),
+        "version": ("GET", f"/api/broker-packs/{first}", {"Accept-Encoding": "identity"}, None),
+        "version_br": ("GET", f"/api/broker-packs/{first}", {"Accept-Encoding": "br"}, None),
+        "version_not_modified": ("GET", f"/api/broker-packs/{first}", {"If-None-Match": "*"}, None),
+        "diff": ("GET", f"/api/broker-packs/diff?from={first}&to={latest}", {}, None),
+        "brokers_page": ("GET", f"/api/broker-packs/{latest}/brokers?limit=50&fields=id,name,opt_out_url", {}, None),
+        "search": ("GET", f"/api/broker-packs/{latest}/search?q=broker 12&form_type=web", {}, None),
+        "status_page": ("GET", "/api/status?limit=100", {}, None),
+        "status_create": ("POST", "/api/status", {}, {"client_name": "benchmark"}),
+        "status_batch": ("POST", "/api/status/batch", {}, [{"client_name": "benchmark"}] * 50),
+        "status_rollup": ("GET", "/api/status/rollup?bucket=hour", {}, None),
+        "status_rollup_client": ("GET", "/api/status/rollup?bucket=minute&client=benchmark", {}, None),
+        "link_health": ("GET", f"/api/broker-packs/{LINKS_VERSION}/link-health", {}, None),
+        "link_health_broken": ("GET", f"/api/broker-packs/{LINKS_VERSION}/link-health?broken_only=true", {}, None),
+        "import": (
+            "POST", "/api/broker-packs/import?set_latest=false", ADMIN_HEADERS,
+            import_body(make_brokers(args.brokers, 0))
+        ),
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client, method, path, headers, body, total, concurrency):
+    latencies = []
+    errors = 0
+    response_bytes = 0
+    issued = 0
+
+    async def worker():
+        nonlocal errors, response_bytes, issued
+        while issued < total:
+            issued += 1
+            started = time.perf_counter()
+            response = await client.request(method, path, headers=headers, **request_body(body))
+            latencies.append(time.perf_counter() - started)
+            response_bytes += len(response.content)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_response_bytes": round(response_bytes / len(latencies)) if latencies else 0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    print(f"{'scenario':<22}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, result in results.items():
+        line = (
+            f"{name:<22}{result['throughput_rps']:>10}{result['p50_ms']:>10}"
+            f"{result['p95_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}"
+        )
+        before = (previous or {}).get(name)
+        if before and before.get("p99_ms"):
+            change = (result["p99_ms"] - before["p99_ms"]) / before["p99_ms"] * 100
+            line += f"   p99 {change:+.1f}% vs {before['p99_ms']} ms"
+        print(line)
+
+
+async def run_benchmark(args):
+    import httpx
+
+    server = load_app(args)
+    links = LinkStandIn()
+    threading.Thread(target=links.serve_forever, daemon=True).start()
+    try:
+        async with server.app.router.lifespan_context(server.app):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                await wait_until_ready(client)
+                await seed(client, args, links)
+                link_check_seconds = await measure_link_check(client)
+                scenarios = build_scenarios(args)
+                results = {}
+                for name, (method, path, headers, body) in scenarios.items():
+                    if args.scenario and name not in args.scenario:
+                        continue
+                    for _ in range(args.warmup):
+                        await client.request(method, path, headers=headers, **request_body(body))
+                    results[name] = await run_scenario(
+                        client, method, path, headers, body, args.requests, args.concurrency
+                    )
+    finally:
+        links.shutdown()
+    return results, link_check_seconds
+
+
+def main():
+    args = parse_args()
+    results, link_check_seconds = asyncio.run(run_benchmark(args))
+    # load_app has set up the environment. mongomock is patched into this process only, which
+    # is fine: importing server does not create the Mongo client.
+    import_seconds = measure_import_seconds(args.import_runs)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "config": {
+            "storage": args.storage,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "brokers": args.brokers,
+            "versions": args.versions,
+            "status_checks": args.status_checks,
+        },
+        "import_seconds": round(import_seconds, 4) if import_seconds is not None else None,
+        "link_check_seconds": round(link_check_seconds, 4),
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+
+    previous = None
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text()).get("results")
+    print_results(results, previous)
+    print(f"\nlink check of {args.brokers} URLs: {link_check_seconds * 1000:.1f} ms")
+    if import_seconds is not None:
+        print(f"import server: {import_seconds * 1000:.1f} ms (best of {args.import_runs})")
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,24 @@ echo "Starting FastAPI backend"
 uvicorn server:app --host 0.0.0.0 --port 8001 &
 BACKEND_PID=$!
 
-echo "Waiting for backend to start..."
-sleep 30
-
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Backend failed to start at initialization, exiting"
-    exit 1
-fi
+# Wait until the backend reports ready (storage reachable, latest broker pack preloaded)
+READY_TIMEOUT=${READY_TIMEOUT:-120}
+echo "Waiting for backend readiness (up to ${READY_TIMEOUT}s)..."
+ticks=0
+until wget -q -T 2 -O /dev/null http://127.0.0.1:8001/api/readyz 2>/dev/null; do
+    if ! kill -0 $BACKEND_PID 2>/dev/null; then
+        echo "Backend failed to start at initialization, exiting"
+        exit 1
+    fi
+    if [ "$ticks" -ge $((READY_TIMEOUT * 2)) ]; then
+        echo "Backend not ready after ${READY_TIMEOUT}s, exiting"
+        kill $BACKEND_PID
+        exit 1
+    fi
+    sleep 0.5
+    ticks=$((ticks + 1))
+done
+echo "Backend ready"
 
 # Start Nginx
 nginx -g 'daemon off;' &
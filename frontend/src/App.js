@@ -186,6 +186,29 @@ const DataWipeLanding = () => {
     brokers: Array.isArray(pack.brokers) ? pack.brokers.map(normalizeBroker) : []
   });
 
+  const applyPackDiff = (pack, diff) => {
+    const removed = new Set(diff.removed || []);
+    const changed = new Map((diff.changed || []).map((broker) => [broker.id, normalizeBroker(broker)]));
+    let brokers = [
+      ...pack.brokers.filter((broker) => !removed.has(broker.id)).map((broker) => changed.get(broker.id) || broker),
+      ...(diff.added || []).map(normalizeBroker)
+    ];
+
+    if (Array.isArray(diff.order)) {
+      const byId = new Map(brokers.map((broker) => [broker.id, broker]));
+      brokers = diff.order.map((id) => byId.get(id)).filter(Boolean);
+    }
+
+    return {
+      ...pack,
+      version: diff.to_version,
+      created_at: diff.created_at,
+      updated_at: diff.updated_at,
+      notes: diff.notes,
+      brokers
+    };
+  };
+
   const [lastSaved, setLastSaved] = React.useState(null);
   const [toast, setToast] = React.useState(null);
   const importInputRef = React.useRef(null);
@@ -229,8 +252,31 @@ const DataWipeLanding = () => {
       }
 
       try {
+        if (backendBase && cachedVersion && Array.isArray(cached?.brokers)) {
+          const diffResponse = await fetch(
+            `${backendBase}/api/broker-packs/diff?from=${encodeURIComponent(cachedVersion)}`,
+            { cache: 'no-cache' }
+          );
+          if (diffResponse.ok) {
+            const diff = await diffResponse.json();
+            if (diff.to_version === cachedVersion) {
+              setPackVersion(cachedVersion);
+              setPackFetchedAt(cached?.fetchedAt || null);
+              return;
+            }
+
+            const updated = applyPackDiff(normalizePack(cached), diff);
+            const fetchedAt = new Date().toISOString();
+            setBrokerPack(updated);
+            setPackVersion(updated.version || '');
+            setPackFetchedAt(fetchedAt);
+            window.localStorage.setItem(PACK_CACHE_KEY, JSON.stringify({ ...updated, fetchedAt }));
+            return;
+          }
+        }
+
         if (backendBase) {
-          const backendResponse = await fetch(`${backendBase}/api/broker-packs/latest`, { cache: 'no-store' });
+          const backendResponse = await fetch(`${backendBase}/api/broker-packs/latest`, { cache: 'no-cache' });
           if (backendResponse.ok) {
             const pack = await backendResponse.json();
             const normalized = normalizePack(pack);
@@ -251,7 +297,7 @@ const DataWipeLanding = () => {
           }
         }
 
-        const latestResponse = await fetch(`${baseUrl}/broker-packs/latest.json`, { cache: 'no-store' });
+        const latestResponse = await fetch(`${baseUrl}/broker-packs/latest.json`, { cache: 'no-cache' });
         if (!latestResponse.ok) {
           throw new Error('Latest broker pack not found');
         }
@@ -269,7 +315,12 @@ const DataWipeLanding = () => {
         const packUrl = latestUrl.startsWith('http')
           ? latestUrl
           : `${baseUrl}${latestUrl.startsWith('/') ? '' : '/'}${latestUrl}`;
-        const packResponse = await fetch(packUrl, { cache: 'no-store' });
+        // Built packs have content-hashed names, so the HTTP cache may keep them; integrity
+        // makes the browser reject a body that does not match latest.json.
+        const packResponse = await fetch(
+          packUrl,
+          latest.integrity ? { integrity: latest.integrity } : { cache: 'no-cache' }
+        );
         if (!packResponse.ok) {
           throw new Error('Broker pack fetch failed');
         }
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+# The backend modules import each other by bare name, as uvicorn runs them from backend/.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# server.py reads its configuration when imported; keep it off any real database.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+ADMIN_TOKEN = "test-token"
+
+
+@pytest.fixture
+def admin_headers():
+    return {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+
+@pytest.fixture
+def run_app():
+    """run_app(scenario, **settings) runs `await scenario(client)` against a new app, once it is ready.
+
+    The app uses in-memory storage, the test admin token and no rate limits unless settings say otherwise.
+    """
+    from server import Settings, create_app
+
+    def run(scenario, **settings):
+        async def main():
+            app = create_app(Settings(**{
+                "storage_backend": "memory", "admin_token": ADMIN_TOKEN, "rate_limit_enabled": False, **settings
+            }))
+            async with app.router.lifespan_context(app):
+                await app.state.warmup["task"]
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    return await scenario(client)
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+
+from server import Settings, create_app
+
+BROKERS = [{"id": "acme", "name": "Acme People Search", "opt_out_url": "https://acme.example/opt-out"}]
+
+
+def test_restarted_app_starts_with_empty_caches(run_app, admin_headers):
+    async def publish(client):
+        response = await client.post(
+            "/api/broker-packs", json={"version": "1.0.0", "brokers": BROKERS}, headers=admin_headers
+        )
+        assert response.status_code == 200
+        assert (await client.get("/api/broker-packs/1.0.0/search", params={"q": "acme"})).json()["total"] == 1
+        return (await client.get("/api/broker-packs/1.0.0")).headers["etag"]
+
+    etag = run_app(publish)
+
+    async def read(client):
+        response = await client.get("/api/broker-packs/1.0.0", headers={"If-None-Match": etag})
+        assert response.status_code == 404
+        assert (await client.get("/api/broker-packs/1.0.0/search", params={"q": "acme"})).status_code == 404
+        assert (await client.get("/api/broker-packs/latest")).status_code == 404
+
+    run_app(read)
+
+
+def test_apps_run_side_by_side_with_their_own_settings():
+    async def main():
+        first = create_app(Settings(storage_backend="memory", admin_token="first", rate_limit_enabled=False))
+        second = create_app(Settings(
+            storage_backend="memory", admin_token="second", rate_limit_enabled=True,
+            rate_limit_public_client_rate=0.001, rate_limit_public_client_burst=1
+        ))
+        async with first.router.lifespan_context(first), second.router.lifespan_context(second):
+            await asyncio.gather(first.state.warmup["task"], second.state.warmup["task"])
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=first), base_url="http://first") as one, \
+                    httpx.AsyncClient(transport=httpx.ASGITransport(app=second), base_url="http://second") as two:
+                response = await one.post(
+                    "/api/broker-packs", json={"version": "1.0.0", "brokers": BROKERS},
+                    headers={"Authorization": "Bearer first"}
+                )
+                assert response.status_code == 200
+                assert (await two.get("/api/admin/profiles", headers={"Authorization": "Bearer first"})).status_code == 401
+
+                assert (await one.get("/api/broker-packs/latest")).status_code == 200
+                assert (await two.get("/api/broker-packs/latest")).status_code == 404
+                # Only the second app limits requests: its one-request burst is now spent.
+                assert (await two.get("/api/broker-packs/latest")).status_code == 429
+                assert [(await one.get("/api/broker-packs/latest")).status_code for _ in range(3)] == [200] * 3
+
+    asyncio.run(main())
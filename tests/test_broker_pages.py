@@ -0,0 +1,44 @@
+BROKERS = [
+    {"id": f"broker-{i}", "name": f"Broker {i}", "opt_out_url": f"https://broker-{i}.example/opt-out"}
+    for i in range(25)
+]
+
+
+async def publish(client, headers):
+    response = await client.post("/api/broker-packs", json={"version": "1.0.0", "brokers": BROKERS}, headers=headers)
+    assert response.status_code == 200
+
+
+def test_pages_cover_the_pack_in_order(run_app, admin_headers):
+    async def scenario(client):
+        await publish(client, admin_headers)
+        ids = []
+        for offset in range(0, 30, 10):
+            page = (await client.get("/api/broker-packs/1.0.0/brokers", params={"offset": offset, "limit": 10})).json()
+            assert page["total"] == 25
+            ids.extend(broker["id"] for broker in page["brokers"])
+        assert ids == [broker["id"] for broker in BROKERS]
+
+        latest = await client.get("/api/broker-packs/latest/brokers", params={"limit": 1})
+        assert latest.json()["version"] == "1.0.0"
+        assert latest.headers["cache-control"] == "no-cache"
+        assert (await client.get("/api/broker-packs/9.9.9/brokers")).status_code == 404
+    run_app(scenario)
+
+
+def test_fields_project_each_broker(run_app, admin_headers):
+    async def scenario(client):
+        await publish(client, admin_headers)
+        page = await client.get("/api/broker-packs/1.0.0/brokers", params={"limit": 2, "fields": "id, name,id"})
+        assert page.json()["brokers"] == [{"id": "broker-0", "name": "Broker 0"}, {"id": "broker-1", "name": "Broker 1"}]
+        unknown = await client.get("/api/broker-packs/1.0.0/brokers", params={"fields": "id,secret"})
+        assert unknown.status_code == 400
+    run_app(scenario)
+
+
+def test_page_size_is_capped_by_settings(run_app, admin_headers):
+    async def scenario(client):
+        await publish(client, admin_headers)
+        assert (await client.get("/api/broker-packs/1.0.0/brokers", params={"limit": 5})).status_code == 200
+        assert (await client.get("/api/broker-packs/1.0.0/brokers", params={"limit": 6})).status_code == 400
+    run_app(scenario, broker_page_max_limit=5)
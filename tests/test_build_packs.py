@@ -0,0 +1,118 @@
+import base64
+import gzip
+import hashlib
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+import build_packs
+
+
+def broker(broker_id, **overrides):
+    return {"id": broker_id, "name": broker_id.upper(), "opt_out_url": f"https://{broker_id}.example/", **overrides}
+
+
+def write_source(directory, version, brokers, **fields):
+    path = directory / f"{version}.json"
+    path.write_text(json.dumps({"version": version, "brokers": brokers, **fields}))
+    return path
+
+
+def build(*args):
+    return CliRunner().invoke(build_packs.app, [str(arg) for arg in args])
+
+
+@pytest.fixture
+def sources(tmp_path):
+    directory = tmp_path / "sources"
+    directory.mkdir()
+    second = [broker("a"), broker("c", opt_out_url="  HTTPS://C.Example")]
+    return [
+        write_source(directory, "1.0.0", [broker("a"), broker("b")]),
+        write_source(directory, "2.0.0", second, updated_at="2024-02-01T00:00:00"),
+    ]
+
+
+def test_build_writes_hashed_precompressed_packs(tmp_path, sources):
+    out = tmp_path / "out"
+    result = build(*sources, "--out", out, "--base-url", "/packs/")
+    assert result.exit_code == 0, result.output
+
+    manifest = json.loads((out / "manifest.json").read_text())
+    assert manifest["latest"] == "2.0.0"
+    for version, entry in manifest["packs"].items():
+        body = (out / entry["file"]).read_bytes()
+        assert entry["file"] == f"{version}.{hashlib.sha256(body).hexdigest()[:build_packs.HASH_LENGTH]}.json"
+        assert entry["integrity"] == "sha256-" + base64.b64encode(hashlib.sha256(body).digest()).decode()
+        assert entry["bytes"] == len(body)
+        assert gzip.decompress((out / entry["encodings"]["gzip"]["file"]).read_bytes()) == body
+        if build_packs.brotli is not None:
+            assert build_packs.brotli.decompress((out / entry["encodings"]["br"]["file"]).read_bytes()) == body
+
+    latest_entry = manifest["packs"]["2.0.0"]
+    pack = json.loads((out / latest_entry["file"]).read_text())
+    assert [entry["opt_out_url"] for entry in pack["brokers"]] == ["https://a.example/", "https://c.example/"]
+    assert json.loads((out / "latest.json").read_text()) == {
+        "version": "2.0.0",
+        "url": f"/packs/{latest_entry['file']}",
+        "updated_at": "2024-02-01T00:00:00",
+        "integrity": latest_entry["integrity"],
+    }
+
+
+def test_rebuilding_unchanged_sources_writes_identical_files(tmp_path, sources):
+    first, second = tmp_path / "first", tmp_path / "second"
+    assert build(*sources, "--out", first).exit_code == 0
+    assert build(*sources, "--out", second).exit_code == 0
+    assert {path.name: path.read_bytes() for path in first.iterdir()} == {
+        path.name: path.read_bytes() for path in second.iterdir()
+    }
+
+
+def test_latest_can_be_chosen(tmp_path, sources):
+    out = tmp_path / "out"
+    assert build(*sources, "--out", out, "--latest", "1.0.0").exit_code == 0
+    assert json.loads((out / "latest.json").read_text())["version"] == "1.0.0"
+
+    result = build(*sources, "--out", tmp_path / "other", "--latest", "9.9.9")
+    assert result.exit_code == 1
+    assert not (tmp_path / "other").exists()
+
+
+def test_invalid_sources_are_reported_and_nothing_is_written(tmp_path, sources):
+    bad = write_source(tmp_path, "3.0.0", [broker("a"), broker("a"), broker("d", opt_out_url="ftp://d.example/")])
+    broken = tmp_path / "broken.json"
+    broken.write_text("{not json")
+    out = tmp_path / "out"
+
+    result = build(*sources, bad, broken, "--out", out)
+    assert result.exit_code == 1
+    assert f"{bad}: brokers.1.id" in result.output
+    assert f"{bad}: brokers.2.opt_out_url" in result.output
+    assert f"{broken}: not valid JSON" in result.output
+    assert not out.exists()
+
+
+def test_a_version_built_from_two_sources_is_rejected(tmp_path, sources):
+    duplicate = tmp_path / "copy.json"
+    duplicate.write_text(sources[0].read_text())
+    result = build(*sources, duplicate, "--out", tmp_path / "out")
+    assert result.exit_code == 1
+    assert "version 1.0.0 is built from more than one source" in result.output
+
+
+@pytest.mark.parametrize("prune", [False, True])
+def test_prune_removes_files_the_previous_build_no_longer_needs(tmp_path, sources, prune):
+    out = tmp_path / "out"
+    assert build(*sources, "--out", out).exit_code == 0
+    old_files = build_packs.manifest_files(json.loads((out / "manifest.json").read_text()))
+
+    write_source(sources[1].parent, "2.0.0", [broker("a"), broker("e")])
+    assert build(*sources, "--out", out, *(["--prune"] if prune else [])).exit_code == 0
+    built = build_packs.manifest_files(json.loads((out / "manifest.json").read_text()))
+    stale = set(old_files) - set(built)
+
+    assert stale and all(name.startswith("2.0.0.") for name in stale)
+    assert all((out / name).exists() for name in built)
+    assert all((out / name).exists() != prune for name in stale)
@@ -0,0 +1,46 @@
+import asyncio
+
+import httpx
+
+from server import Settings, create_app
+
+
+def test_only_the_probes_answer_until_warm_up_is_done():
+    async def main():
+        # Nothing listens on port 1, so every warm-up attempt fails and is retried.
+        app = create_app(Settings(
+            storage_backend="mongo", mongo_url="mongodb://127.0.0.1:1", db_name="unreachable",
+            mongo_server_selection_timeout_ms=50, admin_token="test-token", rate_limit_enabled=False
+        ))
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                for _ in range(100):
+                    if app.state.warmup["detail"].startswith("warm-up failed"):
+                        break
+                    await asyncio.sleep(0.01)
+
+                assert (await client.get("/api/healthz")).status_code == 200
+                ready = await client.get("/api/readyz")
+                assert ready.status_code == 503
+                assert ready.json()["detail"].startswith("warm-up failed: ServerSelectionTimeoutError")
+
+                for method, path in [
+                    ("GET", "/api/broker-packs/latest"),
+                    ("GET", "/api/broker-packs/1.0.0/brokers"),
+                    ("GET", "/api/status"),
+                    ("POST", "/api/status"),
+                ]:
+                    response = await client.request(method, path, json={"client_name": "probe"})
+                    assert response.status_code == 503, path
+                    assert response.headers["retry-after"] == "1"
+
+    asyncio.run(main())
+
+
+def test_ready_app_serves_requests(run_app):
+    async def scenario(client):
+        ready = await client.get("/api/readyz")
+        assert ready.json() == {"status": "ready", "latest_version": None}
+        assert (await client.get("/api/broker-packs/latest")).status_code == 404
+        assert (await client.post("/api/status", json={"client_name": "probe"})).status_code == 200
+    run_app(scenario)
@@ -0,0 +1,67 @@
+import json
+
+MAX_LINE_BYTES = 2000
+
+
+def pack_line(version, **overrides):
+    brokers = [{"id": "a", "name": "A", "opt_out_url": "https://a.example/opt-out"}]
+    return json.dumps({"version": version, "brokers": brokers, **overrides})
+
+
+async def run_import(client, headers, lines, **params):
+    body = "\n".join(lines).encode() + b"\n"
+    return await client.post("/api/broker-packs/import", content=body, params=params, headers=headers)
+
+
+def test_import_reports_conflicts_and_bad_lines_without_stopping(run_app, admin_headers):
+    lines = [
+        pack_line("2.0.0"),
+        "",
+        pack_line("1.0.0"),
+        "{not json",
+        pack_line("2.0.0"),
+        pack_line("4.0.0", notes="x" * MAX_LINE_BYTES),
+        json.dumps({"version": "5.0.0", "brokers": [{"id": "b", "name": "B", "opt_out_url": "ftp://b.example/"}]}),
+        pack_line("3.0.0"),
+    ]
+
+    async def scenario(client):
+        published = await client.post("/api/broker-packs", content=pack_line("1.0.0"), headers=admin_headers)
+        assert published.status_code == 200
+        response = await run_import(client, admin_headers, lines)
+        stored = [(await client.get(f"/api/broker-packs/{version}")).status_code for version in ("2.0.0", "4.0.0")]
+        latest = (await client.get("/api/broker-packs/latest")).json()["version"]
+        return response, stored, latest
+
+    response, stored, latest = run_app(scenario, import_batch_size=2, import_max_line_bytes=MAX_LINE_BYTES)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["imported"] == 2
+    assert result["latest_version"] == "3.0.0"
+    assert result["conflicts"] == ["1.0.0"]
+    errors = {error["line"]: error["detail"] for error in result["errors"]}
+    assert sorted(errors) == [4, 5, 6, 7]
+    assert "Duplicate version" in errors[5]
+    assert errors[6] == f"Line exceeds {MAX_LINE_BYTES} bytes"
+    assert "opt_out_url" in errors[7]
+    assert stored == [200, 404]
+    assert latest == "3.0.0"
+
+
+def test_import_without_set_latest_leaves_the_pointer(run_app, admin_headers):
+    async def scenario(client):
+        await run_import(client, admin_headers, [pack_line("1.0.0")])
+        response = await run_import(client, admin_headers, [pack_line("2.0.0")], set_latest="false")
+        latest = (await client.get("/api/broker-packs/latest")).json()["version"]
+        return response.json(), latest
+
+    result, latest = run_app(scenario)
+    assert result["imported"] == 1 and result["latest_version"] == "2.0.0"
+    assert latest == "1.0.0"
+
+
+def test_import_requires_the_admin_token(run_app):
+    async def scenario(client):
+        return await run_import(client, {"Authorization": "Bearer wrong"}, [pack_line("1.0.0")])
+
+    assert run_app(scenario).status_code == 401
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from server import iter_lines
+
+
+async def chunked(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def split(data, size, max_line_bytes=1024):
+    async def collect():
+        return [line async for line in iter_lines(chunked(data, size), max_line_bytes)]
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 64])
+def test_lines_match_split_at_any_chunk_size(size):
+    data = b'{"a":1}\n\n{"b":2}\nlast'
+    assert split(data, size) == [b'{"a":1}', b"", b'{"b":2}', b"last"]
+
+
+def test_trailing_newline_yields_no_empty_last_line():
+    assert split(b"one\ntwo\n", 3) == [b"one", b"two"]
+
+
+@pytest.mark.parametrize("size", [1, 7, 100])
+def test_line_over_the_limit_is_dropped_and_reading_goes_on(size):
+    data = b"short\n" + b"x" * 20 + b"\nnext\n" + b"y" * 11
+    assert split(data, size, max_line_bytes=10) == [b"short", None, b"next", None]
+
+
+def test_line_at_the_limit_is_accepted():
+    assert split(b"x" * 10 + b"\n" + b"y" * 10, 4, max_line_bytes=10) == [b"x" * 10, b"y" * 10]
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from link_health import LinkChecker, host_lanes
+
+
+class StandIn(ThreadingHTTPServer):
+    """Local server that records requests and how many were in flight at once."""
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            if self.path.startswith("/missing"):
+                status = 404
+            elif self.path.startswith("/no-head") and self.command == "HEAD":
+                status = 405
+            else:
+                status = 200
+            body = b"ok"
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(delay=0.0):
+        server = StandIn(delay)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def checker(clock=None, concurrency=10, per_host=4):
+    return LinkChecker(concurrency, per_host, timeout_seconds=5, ttl_seconds=60, clock=clock or Clock())
+
+
+def test_host_lanes_round_robin_across_hosts():
+    urls = ["http://a/1", "http://a/2", "http://a/3", "http://b/1"]
+    lanes = host_lanes(urls, per_host=2)
+    assert len(lanes) == 3
+    assert [next(lanes[0]), next(lanes[1]), next(lanes[2])] == ["http://a/1", "http://b/1", "http://a/2"]
+
+
+def test_each_distinct_url_is_checked_once(stand_in):
+    server = stand_in()
+    urls = [server.url("/a"), server.url("/b"), server.url("/a"), server.url("/a")]
+    results = asyncio.run(checker().check_all(urls))
+    assert sorted(results) == [server.url("/a"), server.url("/b")]
+    assert all(result["ok"] and result["status"] == 200 for result in results.values())
+    assert sorted(server.requests) == [("HEAD", "/a"), ("HEAD", "/b")]
+
+
+def test_requests_per_host_are_capped(stand_in):
+    busy = stand_in(delay=0.05)
+    other = stand_in(delay=0.05)
+    urls = [busy.url(f"/{i}") for i in range(20)] + [other.url(f"/{i}") for i in range(3)]
+    results = asyncio.run(checker(concurrency=10, per_host=4).check_all(urls))
+    assert len(results) == 23 and all(result["ok"] for result in results.values())
+    assert busy.max_in_flight == 4
+    assert other.max_in_flight <= 3
+
+
+def test_head_refused_falls_back_to_get(stand_in):
+    server = stand_in()
+    result = asyncio.run(checker().check_all([server.url("/no-head")]))[server.url("/no-head")]
+    assert result["ok"] and result["status"] == 200
+    assert server.requests == [("HEAD", "/no-head"), ("GET", "/no-head")]
+
+
+def test_broken_and_unreachable_urls(stand_in):
+    server = stand_in()
+    closed = StandIn()
+    unreachable = closed.url("/")
+    closed.server_close()
+    results = asyncio.run(checker().check_all([server.url("/missing"), unreachable]))
+    assert results[server.url("/missing")]["ok"] is False
+    assert results[server.url("/missing")]["status"] == 404
+    assert results[unreachable]["ok"] is False
+    assert results[unreachable]["status"] is None and results[unreachable]["error"]
+
+
+def test_results_are_reused_until_they_expire(stand_in):
+    server = stand_in()
+    clock = Clock()
+    link_checker = checker(clock)
+    url = server.url("/a")
+
+    async def scenario():
+        await link_checker.check_all([url])
+        clock.now = 59
+        await link_checker.check_all([url])
+        assert link_checker.cached(url) is not None
+        clock.now = 60
+        assert link_checker.cached(url) is None
+        await link_checker.check_all([url])
+
+    asyncio.run(scenario())
+    assert server.requests == [("HEAD", "/a"), ("HEAD", "/a")]
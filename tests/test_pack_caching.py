@@ -0,0 +1,79 @@
+BROKERS = [
+    {"id": f"broker-{i}", "name": f"Broker {i}", "opt_out_url": f"https://broker-{i}.example/opt-out"}
+    for i in range(50)
+]
+
+
+async def publish(client, headers, version="1.0.0"):
+    response = await client.post("/api/broker-packs", json={"version": version, "brokers": BROKERS}, headers=headers)
+    assert response.status_code == 200
+
+
+def test_versioned_pack_is_immutable_and_revalidates(run_app, admin_headers):
+    async def scenario(client):
+        await publish(client, admin_headers)
+        response = await client.get("/api/broker-packs/1.0.0", headers={"Accept-Encoding": "identity"})
+        assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+        etag = response.headers["etag"]
+
+        for candidate in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            revalidated = await client.get("/api/broker-packs/1.0.0", headers={"If-None-Match": candidate})
+            assert revalidated.status_code == 304, candidate
+            assert revalidated.content == b""
+            assert revalidated.headers["cache-control"] == "public, max-age=31536000, immutable"
+        stale = await client.get("/api/broker-packs/1.0.0", headers={"If-None-Match": '"stale"'})
+        assert stale.status_code == 200
+        missing = await client.get("/api/broker-packs/9.9.9", headers={"If-None-Match": etag})
+        assert missing.status_code == 404
+    run_app(scenario)
+
+
+def test_latest_pack_revalidates_until_a_new_publish(run_app, admin_headers):
+    async def scenario(client):
+        await publish(client, admin_headers)
+        latest = await client.get("/api/broker-packs/latest")
+        assert latest.headers["cache-control"] == "no-cache"
+        etag = latest.headers["etag"]
+        assert (await client.get("/api/broker-packs/latest", headers={"If-None-Match": etag})).status_code == 304
+
+        await publish(client, admin_headers, "2.0.0")
+        changed = await client.get("/api/broker-packs/latest", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.json()["version"] == "2.0.0"
+    run_app(scenario)
+
+
+def test_pack_encoding_follows_accept_encoding(run_app, admin_headers):
+    async def scenario(client):
+        await publish(client, admin_headers)
+        responses = {}
+        for accept_encoding in ("identity", "gzip", "gzip, br", "br;q=0, gzip;q=0.5", "*"):
+            responses[accept_encoding] = await client.get(
+                "/api/broker-packs/1.0.0", headers={"Accept-Encoding": accept_encoding}
+            )
+
+        encodings = {name: response.headers.get("content-encoding") for name, response in responses.items()}
+        assert encodings == {
+            "identity": None, "gzip": "gzip", "gzip, br": "br", "br;q=0, gzip;q=0.5": "gzip", "*": "br"
+        }
+        for response in responses.values():
+            assert response.headers["vary"] == "Accept-Encoding"
+            assert response.json()["version"] == "1.0.0"
+        # Each encoding is its own representation with its own ETag, and any of them revalidates.
+        etags = {responses[name].headers["etag"] for name in ("identity", "gzip", "gzip, br")}
+        assert len(etags) == 3
+        for etag in etags:
+            assert (await client.get("/api/broker-packs/1.0.0", headers={"If-None-Match": etag})).status_code == 304
+
+        latest = await client.get("/api/broker-packs/latest", headers={"Accept-Encoding": "gzip"})
+        assert latest.headers["content-encoding"] == "gzip"
+    run_app(scenario)
+
+
+def test_compression_levels_come_from_settings(run_app, admin_headers):
+    async def encoded_size(client):
+        await publish(client, admin_headers)
+        response = await client.get("/api/broker-packs/1.0.0", headers={"Accept-Encoding": "gzip"})
+        return int(response.headers["content-length"])
+
+    assert run_app(encoded_size, pack_gzip_level=1) > run_app(encoded_size, pack_gzip_level=9)
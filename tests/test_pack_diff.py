@@ -0,0 +1,89 @@
+import pytest
+
+from models import BrokerEntry
+from server import compute_pack_diff
+
+
+def broker(broker_id, name=None):
+    return {"id": broker_id, "name": name or broker_id.upper(), "opt_out_url": f"https://{broker_id}.example/"}
+
+
+def pack(version, brokers):
+    created_at = "2024-01-01T00:00:00"
+    return {"version": version, "created_at": created_at, "updated_at": created_at, "brokers": brokers}
+
+
+def apply_diff(brokers, diff):
+    """Bring a client's copy of the from-version brokers up to date."""
+    changed = {entry["id"]: entry for entry in diff["changed"]}
+    removed = set(diff["removed"])
+    updated = [changed.get(entry["id"], entry) for entry in brokers if entry["id"] not in removed]
+    updated += diff["added"]
+    if diff["order"] is not None:
+        by_id = {entry["id"]: entry for entry in updated}
+        updated = [by_id[broker_id] for broker_id in diff["order"]]
+    return updated
+
+
+def normalized(brokers):
+    return [BrokerEntry(**entry).dict() for entry in brokers]
+
+
+@pytest.mark.parametrize("old, new, needs_order", [
+    ([broker("a"), broker("b")], [broker("a"), broker("b"), broker("c")], False),
+    ([broker("a"), broker("b"), broker("c")], [broker("a"), broker("c")], False),
+    ([broker("a"), broker("b")], [broker("a", "Renamed"), broker("b")], False),
+    ([broker("a"), broker("b"), broker("c")], [broker("c"), broker("a"), broker("b")], True),
+    ([broker("a"), broker("b")], [broker("c"), broker("a"), broker("b")], True),
+    ([broker("a"), broker("b"), broker("c")], [broker("a"), broker("d"), broker("c", "Renamed")], True),
+    ([], [broker("a"), broker("b")], False),
+    ([broker("a")], [], False),
+])
+def test_applying_the_diff_reproduces_the_new_pack(old, new, needs_order):
+    diff = compute_pack_diff(pack("1", old), pack("2", new))
+    assert apply_diff(normalized(old), diff) == normalized(new)
+    assert (diff["order"] is not None) == needs_order
+
+
+def test_diff_lists_only_what_changed():
+    diff = compute_pack_diff(
+        pack("1", [broker("a"), broker("b"), broker("c")]),
+        pack("2", [broker("a"), broker("b", "Renamed"), broker("d")])
+    )
+    assert (diff["from_version"], diff["to_version"]) == ("1", "2")
+    assert [entry["id"] for entry in diff["added"]] == ["d"]
+    assert [(entry["id"], entry["name"]) for entry in diff["changed"]] == [("b", "Renamed")]
+    assert diff["removed"] == ["c"]
+
+
+def test_diff_endpoint_serves_stored_and_computed_pairs(run_app, admin_headers):
+    versions = {
+        "1": [broker("a"), broker("b")],
+        "2": [broker("a"), broker("b", "Renamed")],
+        "3": [broker("c"), broker("a"), broker("b", "Renamed")],
+    }
+
+    async def scenario(client):
+        for version, brokers in versions.items():
+            body = {"version": version, "brokers": brokers}
+            response = await client.post("/api/broker-packs", json=body, headers=admin_headers)
+            assert response.status_code == 200
+        return {
+            "stored": await client.get("/api/broker-packs/diff", params={"from": "2", "to": "3"}),
+            "computed": await client.get("/api/broker-packs/diff", params={"from": "1", "to": "3"}),
+            "cached": await client.get("/api/broker-packs/diff", params={"from": "1", "to": "3"}),
+            "latest": await client.get("/api/broker-packs/diff", params={"from": "1"}),
+            "missing": await client.get("/api/broker-packs/diff", params={"from": "0", "to": "3"}),
+        }
+
+    # With a history of 1, only the diff from the previous version is stored on publish.
+    responses = run_app(scenario, broker_pack_diff_history=1)
+    stored, computed = responses["stored"].json(), responses["computed"].json()
+    assert [entry["id"] for entry in stored["added"]] == ["c"]
+    assert stored["order"] == ["c", "a", "b"]
+    assert apply_diff(normalized(versions["1"]), computed) == normalized(versions["3"])
+    assert responses["cached"].json() == computed
+    assert responses["computed"].headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert responses["latest"].json() == computed
+    assert responses["latest"].headers["cache-control"] == "no-cache"
+    assert responses["missing"].status_code == 404
@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+import pytest
+
+from models import BrokerEntry, BrokerPackCreate
+from pack_validation import DEFAULT_FORM_TYPES, PackStreamError, PackStreamParser, PackValidator, read_pack
+
+PACK = {
+    "version": "2.0.0",
+    "notes": "Ünïcode – and \"escapes\"\n",
+    "brokers": [
+        {"id": "a", "name": "Acme", "opt_out_url": "https://a.example/opt-out", "form_type": "web"},
+        {"id": "b", "name": "Bee 🐝", "opt_out_url": "https://b.example/", "required_fields": ["Email"]},
+    ],
+    "priority": 1.5,
+    "weights": [1e3, -2, 0.25, 1E-2, 10],
+    "count": 120,
+    "flags": [True, False, None],
+}
+
+
+async def chunked(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def split_at(data, position):
+    yield data[:position]
+    yield data[position:]
+
+
+def parse(chunks, max_value_bytes=1024):
+    async def collect():
+        fields, brokers = {}, []
+        async for kind, key, value in PackStreamParser(chunks, max_value_bytes).events():
+            if kind == "field":
+                fields[key] = value
+            else:
+                assert key == len(brokers)
+                brokers.append(value)
+        return {**fields, "brokers": brokers}
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("separators", [(",", ":"), (", ", ": ")])
+def test_every_chunk_boundary_parses_the_same(separators):
+    data = json.dumps(PACK, ensure_ascii=False, separators=separators).encode()
+    for position in range(len(data) + 1):
+        assert parse(split_at(data, position)) == PACK, position
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_small_chunks_parse_the_same(size):
+    data = json.dumps(PACK, ensure_ascii=False).encode()
+    assert parse(chunked(data, size)) == PACK
+
+
+@pytest.mark.parametrize("number", ["1.5", "1e3", "-2", "1E-2", "120"])
+def test_number_split_anywhere_is_read_whole(number):
+    data = f'{{"version": "1", "n": {number}}}'.encode()
+    for position in range(len(data) + 1):
+        assert parse(split_at(data, position))["n"] == json.loads(number), position
+
+
+@pytest.mark.parametrize("data, message", [
+    (b'["not", "an", "object"]', "Expected '{'"),
+    (b'{1: "one"}', "Expected a field name"),
+    (b'{"version": "1",}', "Invalid JSON"),
+    (b'{"brokers": [], "brokers": []}', "Duplicate brokers field"),
+    (b'{"version": "1"} trailing', "Unexpected data after the pack object"),
+    (b'{"version": "1"', "Expected ',' or '}', found end of body"),
+    (b'{"n": 1.}', "found '.'"),
+])
+def test_malformed_bodies_are_rejected(data, message):
+    with pytest.raises(PackStreamError, match=message):
+        parse(chunked(data, 3))
+
+
+def test_value_over_the_limit_is_rejected():
+    data = json.dumps({"notes": "x" * 100}).encode()
+    with pytest.raises(PackStreamError, match="exceeds 50 bytes"):
+        parse(chunked(data, 8), max_value_bytes=50)
+
+
+def validate(pack, batch_size=2, max_errors=1000):
+    validator = PackValidator(BrokerEntry, DEFAULT_FORM_TYPES, max_errors)
+    parser = PackStreamParser(chunked(json.dumps(pack).encode(), 16), 1024)
+    fields, entries = asyncio.run(read_pack(parser, validator, BrokerPackCreate, batch_size, True))
+    return validator, fields, entries
+
+
+def broker(broker_id, **overrides):
+    return {"id": broker_id, "name": broker_id.upper(), "opt_out_url": f"https://{broker_id}.example/", **overrides}
+
+
+def test_valid_pack_is_normalized():
+    validator, fields, entries = validate({
+        "version": "1", "brokers": [broker("a", opt_out_url="  HTTPS://A.Example"), broker("b")]
+    })
+    assert validator.errors == []
+    assert fields["version"] == "1" and fields["brokers"] == []
+    assert [entry["opt_out_url"] for entry in entries] == ["https://a.example/", "https://b.example/"]
+
+
+def test_entry_errors_are_reported_by_index():
+    validator, _, entries = validate({"version": "1", "brokers": [
+        broker("a"),
+        {"id": "b", "opt_out_url": "https://b.example/"},
+        broker("a"),
+        broker("c", opt_out_url="ftp://c.example/"),
+        broker("d", form_type="fax"),
+    ]})
+    assert [(error["loc"], error["type"]) for error in validator.errors] == [
+        (["body", "brokers", 1, "name"], "missing"),
+        (["body", "brokers", 2, "id"], "value_error.duplicate"),
+        (["body", "brokers", 3, "opt_out_url"], "value_error.url"),
+        (["body", "brokers", 4, "form_type"], "value_error.form_type"),
+    ]
+    assert [entry["id"] for entry in entries] == ["a"]
+
+
+def test_missing_top_level_field_is_reported():
+    validator, fields, _ = validate({"brokers": [broker("a")]})
+    assert fields is None
+    assert validator.errors[0]["loc"] == ["body", "version"]
+
+
+def test_errors_beyond_max_errors_are_counted_not_kept():
+    validator, _, _ = validate(
+        {"version": "1", "brokers": [broker(f"b{i}", form_type="fax") for i in range(5)]}, max_errors=2
+    )
+    assert validator.error_count == 5
+    assert len(validator.errors) == 2
@@ -0,0 +1,42 @@
+from ratelimit import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_client_bucket_refills_over_time():
+    clock = Clock()
+    limiter = RateLimiter(client_rate=1, client_burst=2, global_rate=0, global_burst=0, clock=clock)
+    assert limiter.acquire("a") == (None, None)
+    assert limiter.acquire("a") == (None, None)
+    scope, retry_after = limiter.acquire("a")
+    assert scope == "client" and retry_after == 1.0
+    assert limiter.acquire("b") == (None, None)
+    clock.now = 1.0
+    assert limiter.acquire("a") == (None, None)
+
+
+def test_global_bucket_limits_all_clients():
+    limiter = RateLimiter(client_rate=10, client_burst=10, global_rate=1, global_burst=2, clock=Clock())
+    assert limiter.acquire("a") == (None, None)
+    assert limiter.acquire("b") == (None, None)
+    assert limiter.acquire("c")[0] == "global"
+
+
+def test_unauthenticated_requests_cannot_drain_a_reserved_global_bucket():
+    limiter = RateLimiter(
+        client_rate=1, client_burst=3, global_rate=1, global_burst=2,
+        global_authenticated_only=True, clock=Clock()
+    )
+    for client in ("a", "b", "c"):
+        for _ in range(3):
+            assert limiter.acquire(client, authenticated=False) == (None, None)
+        assert limiter.acquire(client, authenticated=False)[0] == "client"
+    assert limiter.acquire("admin", authenticated=True) == (None, None)
+    assert limiter.acquire("admin", authenticated=True) == (None, None)
+    assert limiter.acquire("admin", authenticated=True)[0] == "global"
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from server import SCHEMA_VERSION, MigrationInProgress, apply_schema_migrations
+from storage import MemoryStorage, MongoStorage, SQLiteStorage
+
+STATUS_CHECKS = [
+    {"id": f"check-{i}", "client_name": f"client-{i % 3}", "timestamp": datetime(2024, 1, 1, i % 5, i)}
+    for i in range(40)
+]
+
+
+async def seed_schema_2(storage):
+    """Status checks as a schema 2 server left them: stored, but never rolled up."""
+    await storage.status_checks.insert_many(STATUS_CHECKS)
+    await storage.status_checks.clear_rollups()
+    await storage.set_schema_version(2, datetime.utcnow().isoformat())
+
+
+async def day_total(storage):
+    rollups = await storage.status_checks.rollups("day", None, datetime(2024, 1, 1), datetime(2024, 1, 2))
+    return sum(rollup["count"] for rollup in rollups)
+
+
+def mongo_storage():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return MongoStorage(mongomock_motor.AsyncMongoMockClient(), "test")
+
+
+def test_one_server_backfills_while_the_others_wait(tmp_path):
+    path = str(tmp_path / "shared.db")
+
+    async def scenario():
+        servers = [SQLiteStorage(path) for _ in range(3)]
+        await seed_schema_2(servers[0])
+        results = await asyncio.gather(
+            *(apply_schema_migrations(storage) for storage in servers), return_exceptions=True
+        )
+        # The waiting servers retry warm-up, and by then the migration is done.
+        for storage, result in zip(servers, results):
+            if isinstance(result, MigrationInProgress):
+                await apply_schema_migrations(storage)
+        return results, await day_total(servers[0]), await servers[0].get_schema_version()
+
+    results, total, version = asyncio.run(scenario())
+    assert results.count(None) >= 1
+    assert all(result is None or isinstance(result, MigrationInProgress) for result in results)
+    assert total == len(STATUS_CHECKS)
+    assert version == SCHEMA_VERSION
+
+
+def test_held_lease_blocks_migration_until_released(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "lease.db"))
+        await seed_schema_2(storage)
+        assert await storage.claim_migration("other", timedelta(minutes=1))
+        with pytest.raises(MigrationInProgress):
+            await apply_schema_migrations(storage)
+        assert await day_total(storage) == 0
+
+        await storage.release_migration("other")
+        await apply_schema_migrations(storage)
+        await apply_schema_migrations(storage)
+        return await day_total(storage)
+
+    assert asyncio.run(scenario()) == len(STATUS_CHECKS)
+
+
+@pytest.mark.parametrize("make_storage", [MemoryStorage, lambda: SQLiteStorage(":memory:"), mongo_storage])
+def test_lease_lapses_when_its_holder_stops_renewing(make_storage):
+    async def scenario():
+        storage = make_storage()
+        assert await storage.claim_migration("first", timedelta(minutes=1))
+        assert await storage.claim_migration("first", timedelta(minutes=1))
+        assert not await storage.claim_migration("second", timedelta(minutes=1))
+
+        assert await storage.claim_migration("first", timedelta(0))
+        assert await storage.claim_migration("second", timedelta(minutes=1))
+        await storage.release_migration("first")
+        return await storage.claim_migration("third", timedelta(minutes=1))
+
+    assert asyncio.run(scenario()) is False
@@ -0,0 +1,60 @@
+import pytest
+
+from server import BrokerSearchIndex
+
+BROKERS = [
+    {"id": "acme", "name": "Acme People Search", "form_type": "web", "required_fields": ["Email"]},
+    {"id": "acme-data", "name": "Acme Data", "form_type": "email", "required_fields": ["Email", "Address"]},
+    {"id": "peoplefinder", "name": "People Finder", "form_type": "web", "required_fields": ["Address"]},
+    {"id": "searchly", "name": "Acme", "form_type": "mail", "required_fields": []},
+]
+
+
+def search(q, **options):
+    total, results = BrokerSearchIndex(BROKERS).search(q, **options)
+    return total, [broker["id"] for broker in results]
+
+
+@pytest.mark.parametrize("q, expected", [
+    # The whole query as an id wins; exact tokens beat prefixes and ids beat names.
+    ("acme", ["acme", "acme-data", "searchly"]),
+    ("ACME", ["acme", "acme-data", "searchly"]),
+    ("peo", ["peoplefinder", "acme"]),
+    # Scores add up across tokens, and every token has to match.
+    ("acme se", ["acme", "searchly"]),
+    ("data acme", ["acme-data"]),
+    # Equal scores keep pack order.
+    ("a", ["acme", "acme-data", "searchly", "peoplefinder"]),
+    ("acme zzz", []),
+    ("zzz", []),
+])
+def test_results_are_ranked_by_score_then_pack_order(q, expected):
+    assert search(q) == (len(expected), expected)
+
+
+@pytest.mark.parametrize("options, expected", [
+    ({"form_type": "WEB"}, ["acme", "peoplefinder"]),
+    ({"required_field": "email"}, ["acme", "acme-data"]),
+    ({"form_type": "web", "required_field": "Email"}, ["acme"]),
+    ({"form_type": "fax"}, []),
+])
+def test_filters_apply_with_and_without_a_query(options, expected):
+    assert search(None, **options) == (len(expected), expected)
+    assert search("a", **options) == (len(expected), expected)
+
+
+def test_exact_id_outside_the_filters_is_left_out():
+    assert search("acme", form_type="email") == (1, ["acme-data"])
+
+
+def test_limit_cuts_results_but_not_the_total():
+    assert search("a", limit=2) == (4, ["acme", "acme-data"])
+    assert search(None, required_field="address", limit=1) == (2, ["acme-data"])
+    assert search("", limit=3) == (4, ["acme", "acme-data", "peoplefinder"])
+
+
+def test_repeated_searches_rank_the_same():
+    index = BrokerSearchIndex(BROKERS)
+    first = index.search("acme")
+    assert index.search("acme") == first
+    assert index.search("acm") == (3, [BROKERS[0], BROKERS[1], BROKERS[3]])
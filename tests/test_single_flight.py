@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from server import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def scenario():
+        group = SingleFlight("test")
+        results = await asyncio.gather(*(group.do("key", load) for _ in range(5)))
+        return results, group.calls
+
+    results, pending = asyncio.run(scenario())
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+    assert pending == {}
+
+
+def test_every_caller_gets_the_error_and_the_next_call_retries():
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("storage down")
+
+    async def scenario():
+        group = SingleFlight("test")
+        results = await asyncio.gather(*(group.do("key", failing) for _ in range(3)), return_exceptions=True)
+        retried = await group.do("key", lambda: asyncio.sleep(0, result="recovered"))
+        return results, retried
+
+    results, retried = asyncio.run(scenario())
+    assert [type(result) for result in results] == [RuntimeError] * 3
+    assert len(calls) == 1
+    assert retried == "recovered"
+
+
+def test_cancelled_caller_does_not_cancel_the_call_for_others():
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "value"
+
+    async def scenario():
+        group = SingleFlight("test")
+        first = asyncio.ensure_future(group.do("key", slow))
+        second = asyncio.ensure_future(group.do("key", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "value"
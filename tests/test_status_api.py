@@ -0,0 +1,62 @@
+import base64
+
+
+def cursor(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+async def post_checks(client, count):
+    response = await client.post("/api/status/batch", json=[{"client_name": f"client-{i}"} for i in range(count)])
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_status_pages_follow_the_cursor(run_app):
+    async def scenario(client):
+        created = await post_checks(client, 5)
+
+        seen, next_cursor, pages = [], None, 0
+        while True:
+            params = {"limit": 2, **({"cursor": next_cursor} if next_cursor else {})}
+            response = await client.get("/api/status", params=params)
+            assert response.status_code == 200
+            seen.extend(check["id"] for check in response.json())
+            pages += 1
+            next_cursor = response.headers.get("x-next-cursor")
+            if not next_cursor:
+                break
+
+        assert pages == 3
+        assert sorted(seen) == sorted(check["id"] for check in created)
+        assert len(set(seen)) == 5
+    run_app(scenario)
+
+
+def test_ndjson_stream_continues_from_a_cursor(run_app):
+    async def scenario(client):
+        await post_checks(client, 4)
+        first = await client.get("/api/status", params={"limit": 1})
+        stream = await client.get("/api/status", params={"format": "ndjson", "cursor": first.headers["x-next-cursor"]})
+        assert stream.headers["content-type"] == "application/x-ndjson"
+        assert len(stream.text.splitlines()) == 3
+    run_app(scenario)
+
+
+def test_cursor_with_utc_offset_is_compared_as_utc(run_app):
+    async def scenario(client):
+        await post_checks(client, 3)
+        future = await client.get("/api/status", params={"cursor": cursor("2999-01-01T00:00:00+00:00|x")})
+        assert future.status_code == 200
+        assert future.json() == []
+
+        past = await client.get("/api/status", params={"cursor": cursor("2000-01-01T02:00:00+02:00|x")})
+        assert past.status_code == 200
+        assert len(past.json()) == 3
+    run_app(scenario)
+
+
+def test_malformed_cursor_is_rejected(run_app):
+    async def scenario(client):
+        for value in ("not-a-cursor", cursor("no separator"), cursor("yesterday|x")):
+            assert (await client.get("/api/status", params={"cursor": value})).status_code == 400, value
+    run_app(scenario)
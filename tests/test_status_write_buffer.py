@@ -0,0 +1,99 @@
+import asyncio
+
+from server import StatusWriteBuffer
+
+
+class SlowStorage:
+    def __init__(self, delay=0.0, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.inserted = []
+        self.calls = 0
+
+    async def insert(self, documents):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("storage unavailable")
+        self.inserted.extend(documents)
+
+
+def checks(count):
+    return [{"id": str(i), "client_name": "c"} for i in range(count)]
+
+
+def test_flushes_when_max_items_are_pending():
+    async def scenario():
+        storage = SlowStorage()
+        buffer = StatusWriteBuffer(storage.insert, max_items=3, max_delay_seconds=60)
+        for document in checks(4):
+            await buffer.add(document)
+        return storage, buffer
+
+    storage, buffer = asyncio.run(scenario())
+    assert [document["id"] for document in storage.inserted] == ["0", "1", "2"]
+    assert [document["id"] for document in buffer.pending] == ["3"]
+
+
+def test_flushes_on_the_interval():
+    async def scenario():
+        storage = SlowStorage()
+        buffer = StatusWriteBuffer(storage.insert, max_items=100, max_delay_seconds=0.01)
+        buffer.start()
+        for document in checks(5):
+            await buffer.add(document)
+        await asyncio.sleep(0.05)
+        inserted = len(storage.inserted)
+        await buffer.stop()
+        return inserted
+
+    assert asyncio.run(scenario()) == 5
+
+
+def test_stop_waits_for_a_flush_in_progress():
+    async def scenario():
+        storage = SlowStorage(delay=0.1)
+        buffer = StatusWriteBuffer(storage.insert, max_items=100, max_delay_seconds=0.01)
+        buffer.start()
+        for document in checks(10):
+            await buffer.add(document)
+        # Let the interval flush start its slow insert, then stop in the middle of it.
+        await asyncio.sleep(0.03)
+        assert storage.calls == 1 and not storage.inserted
+        await buffer.stop()
+        return storage, buffer
+
+    storage, buffer = asyncio.run(scenario())
+    assert len(storage.inserted) == 10
+    assert buffer.pending == []
+
+
+def test_failed_flush_keeps_the_batch_for_the_next_flush():
+    async def scenario():
+        storage = SlowStorage(failures=1)
+        buffer = StatusWriteBuffer(storage.insert, max_items=100, max_delay_seconds=60)
+        for document in checks(3):
+            await buffer.add(document)
+        assert await buffer.flush() is False
+        await buffer.add({"id": "3", "client_name": "c"})
+        assert await buffer.flush() is True
+        return storage
+
+    storage = asyncio.run(scenario())
+    assert [document["id"] for document in storage.inserted] == ["0", "1", "2", "3"]
+
+
+def test_cancelled_flush_keeps_the_batch():
+    async def scenario():
+        storage = SlowStorage(delay=1)
+        buffer = StatusWriteBuffer(storage.insert, max_items=100, max_delay_seconds=60)
+        for document in checks(2):
+            await buffer.add(document)
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.01)
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        return buffer
+
+    assert len(asyncio.run(scenario()).pending) == 2
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from storage import MemoryStorage, MongoStorage, SQLiteStorage, broker_entry_hash
+
+SHARED = [{"id": f"shared-{i}", "name": f"Shared {i}", "opt_out_url": f"https://s{i}.example/"} for i in range(3)]
+
+
+def pack(version, created_at, brokers):
+    return {
+        "version": version,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "notes": None,
+        "brokers": brokers,
+        "etag": f'"{version}"',
+        "encodings": {"gzip": f"gzip {version}".encode(), "br": f"br {version}".encode()},
+    }
+
+
+PACKS = [
+    pack("1.0.0", "2024-01-01T00:00:00", SHARED + [{"id": "old", "name": "Old", "opt_out_url": "https://o.example/"}]),
+    pack("2.0.0", "2024-02-01T00:00:00", [{"id": "new", "name": "New", "opt_out_url": "https://n.example/"}] + SHARED),
+]
+
+
+@pytest.fixture(params=["memory", "sqlite", "mongo"])
+def open_storage(request, tmp_path):
+    """Opens the parametrized backend; every call after the first sees the same data with cold caches."""
+    if request.param == "memory":
+        storage = MemoryStorage()
+        return lambda: storage
+    if request.param == "sqlite":
+        return lambda: SQLiteStorage(str(tmp_path / "packs.db"))
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    client = mongomock_motor.AsyncMongoMockClient()
+    return lambda: MongoStorage(client, "test")
+
+
+async def entry_count(storage):
+    if isinstance(storage, MemoryStorage):
+        return len(storage.packs.entries)
+    if isinstance(storage, SQLiteStorage):
+        return (await storage.database.fetch_one("SELECT COUNT(*) AS count FROM broker_entries"))["count"]
+    return await storage.db.broker_entries.count_documents({})
+
+
+async def insert_legacy(storage, legacy):
+    """Store a pack the way servers before the entry store did, with its brokers inline."""
+    document = {key: value for key, value in legacy.items() if key != "encodings"}
+    if isinstance(storage, SQLiteStorage):
+        await storage.database.execute(
+            "INSERT INTO broker_packs (version, created_at, etag, document) VALUES (?, ?, ?, ?)",
+            (legacy["version"], legacy["created_at"], legacy["etag"], json.dumps(document))
+        )
+    else:
+        await storage.db.broker_packs.insert_one({**document, "_id": legacy["version"]})
+
+
+def strip(document):
+    return {key: value for key, value in document.items() if key != "_id"}
+
+
+def test_packs_read_back_whole(open_storage):
+    async def scenario():
+        storage = open_storage()
+        await storage.packs.insert_many(PACKS)
+
+        reopened = open_storage()
+        stored = strip(await reopened.packs.get("2.0.0"))
+        assert stored == PACKS[1]
+        assert "encodings" not in await reopened.packs.get("2.0.0", include_encodings=False)
+        bare = await reopened.packs.get("2.0.0", include_brokers=False)
+        assert "brokers" not in bare and "broker_hashes" not in bare
+        assert await reopened.packs.get("9.9.9") is None
+
+        assert await reopened.packs.get_etag("1.0.0") == (True, '"1.0.0"')
+        assert await reopened.packs.get_etag("9.9.9") == (False, None)
+        assert await reopened.packs.existing_versions(["1.0.0", "9.9.9", "2.0.0"]) == {"1.0.0", "2.0.0"}
+        assert await reopened.packs.exists("1.0.0") and not await reopened.packs.exists("9.9.9")
+        assert [strip(found)["brokers"] for found in await reopened.packs.get_many(["1.0.0"])] == [PACKS[0]["brokers"]]
+        assert [found["version"] for found in await reopened.packs.recent(5)] == ["2.0.0", "1.0.0"]
+        assert await reopened.packs.get_brokers("1.0.0") == PACKS[0]["brokers"]
+
+    asyncio.run(scenario())
+
+
+def test_broker_pages_slice_and_project(open_storage):
+    async def scenario():
+        await open_storage().packs.insert_many(PACKS)
+        packs = open_storage().packs
+        assert await packs.get_broker_page("2.0.0", 1, 2) == (4, SHARED[:2])
+        assert await packs.get_broker_page("2.0.0", 3, 10, ["id"]) == (4, [{"id": "shared-2"}])
+        assert await packs.get_broker_page("2.0.0", 10, 10) == (4, [])
+        assert await packs.get_broker_page("9.9.9", 0, 10) is None
+
+    asyncio.run(scenario())
+
+
+def test_latest_version_falls_back_to_the_newest_pack(open_storage):
+    async def scenario():
+        storage = open_storage()
+        assert await storage.packs.get_latest_version() is None
+        await storage.packs.insert_many(PACKS)
+        newest = await storage.packs.get_latest_version()
+        await storage.packs.set_latest_version("1.0.0", "2024-03-01T00:00:00")
+        return newest, await open_storage().packs.get_latest_version()
+
+    assert asyncio.run(scenario()) == ("2.0.0", "1.0.0")
+
+
+def test_diffs_round_trip(open_storage):
+    diff = {"from_version": "1.0.0", "to_version": "2.0.0", "added": [], "changed": [], "removed": ["old"]}
+
+    async def scenario():
+        storage = open_storage()
+        await storage.packs.save_diff(diff)
+        return await storage.packs.get_diff("1.0.0", "2.0.0"), await storage.packs.get_diff("2.0.0", "1.0.0")
+
+    found, missing = asyncio.run(scenario())
+    assert strip(found) == diff
+    assert missing is None
+
+
+def test_entries_shared_across_versions_are_stored_once(open_storage):
+    async def scenario():
+        storage = open_storage()
+        await storage.packs.insert_many(PACKS)
+        await storage.packs.insert(pack("3.0.0", "2024-03-01T00:00:00", list(reversed(SHARED))))
+        reopened = open_storage()
+        return await entry_count(storage), strip(await reopened.packs.get("3.0.0"))["brokers"]
+
+    entries, brokers = asyncio.run(scenario())
+    assert entries == 5
+    assert brokers == list(reversed(SHARED))
+
+
+def test_legacy_packs_are_assembled_and_deduplicated(open_storage):
+    if isinstance(open_storage(), MemoryStorage):
+        pytest.skip("memory storage never holds packs from older servers")
+    legacy = {key: value for key, value in PACKS[0].items() if key != "encodings"}
+
+    async def scenario():
+        storage = open_storage()
+        await insert_legacy(storage, legacy)
+        before = strip(await storage.packs.get("1.0.0", include_encodings=False))
+        migrated = await storage.packs.deduplicate_legacy_packs()
+        again = await storage.packs.deduplicate_legacy_packs()
+        after = strip(await open_storage().packs.get("1.0.0", include_encodings=False))
+        return before, migrated, again, after, await entry_count(storage)
+
+    before, migrated, again, after, entries = asyncio.run(scenario())
+    assert before["brokers"] == after["brokers"] == legacy["brokers"]
+    assert (migrated, again, entries) == (1, 0, 4)
+
+
+def test_sqlite_publish_is_all_or_nothing(tmp_path):
+    fresh = pack("3.0.0", "2024-03-01T00:00:00", [{"id": "fresh", "name": "Fresh", "opt_out_url": "https://f.example/"}])
+
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "packs.db"))
+        await storage.packs.insert(PACKS[0])
+        with pytest.raises(sqlite3.IntegrityError):
+            await storage.packs.insert_many([fresh, PACKS[0]])
+        stored = await storage.database.fetch_one(
+            "SELECT COUNT(*) AS count FROM broker_entries WHERE hash = ?", (broker_entry_hash(fresh["brokers"][0]),)
+        )
+        encodings = await storage.database.fetch_one(
+            "SELECT COUNT(*) AS count FROM broker_pack_encodings WHERE version = '3.0.0'"
+        )
+        return await storage.packs.exists("3.0.0"), stored["count"], encodings["count"]
+
+    assert asyncio.run(scenario()) == (False, 0, 0)